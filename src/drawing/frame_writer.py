@@ -0,0 +1,90 @@
+from src.utilities.utilities import log, make_path
+
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(rgb, size, level=6):
+    """ Encodes raw RGB bytes (rows from the top) of an image of size (width, height) as a PNG. The work is done by
+    zlib and NumPy, which release the GIL, so that encoding in a thread does not stop the simulation. """
+    width, height = size
+    rows = np.zeros((height, 1 + 3 * width), dtype=np.uint8)   # every row starts with its filter type, 0 (none)
+    rows[:, 1:] = np.frombuffer(rgb, dtype=np.uint8).reshape(height, 3 * width)
+    return b"".join([b"\x89PNG\r\n\x1a\n",
+                     png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+                     png_chunk(b"IDAT", zlib.compress(rows.data, level)),
+                     png_chunk(b"IEND", b"")])
+
+
+class FrameWriter:
+    """ Saves the frames of the simulation in background threads. save() only puts the raw pixels of the frame in a
+    bounded queue, the workers encode the PNG images and write them to disk while the simulation goes on. When the
+    queue is full the simulation waits for a free place (backpressure), or the frame is dropped if drop_when_full. """
+
+    def __init__(self, n_workers=2, max_queued=32, drop_when_full=False):
+        self.drop_when_full = drop_when_full
+        self.frames = queue.Queue(maxsize=max_queued)
+
+        # statistics
+        self.n_queued, self.n_saved, self.n_dropped, self.n_failed = 0, 0, 0, 0
+        self.max_queue_length = 0
+        self.wait_sec = 0   # time the simulation waited for a place in the queue
+        self.__lock = threading.Lock()
+
+        self.workers = [threading.Thread(target=self.__work, daemon=True) for _ in range(n_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def save(self, rgb, size, filename):
+        """ Queues the raw RGB bytes of an image of size (width, height), e.g. from stddraw.pixels(), to be saved in
+        filename as a PNG, returns whether they were queued. """
+        frame = (rgb, size, filename)
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            if self.drop_when_full:
+                self.n_dropped += 1
+                return False
+            started = time.time()
+            self.frames.put(frame)
+            self.wait_sec += time.time() - started
+        self.n_queued += 1
+        self.max_queue_length = max(self.max_queue_length, self.frames.qsize())
+        return True
+
+    def __work(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            rgb, size, filename = frame
+            try:
+                make_path(filename)
+                with open(filename, "wb") as out_file:
+                    out_file.write(encode_png(rgb, size))
+                with self.__lock:
+                    self.n_saved += 1
+            except Exception as e:
+                with self.__lock:
+                    self.n_failed += 1
+                log("Frame {} not saved: {}".format(filename, e))
+
+    def statistics(self):
+        return {"queued": self.n_queued, "saved": self.n_saved, "dropped": self.n_dropped, "failed": self.n_failed,
+                "max_queue_length": self.max_queue_length, "wait_sec": self.wait_sec}
+
+    def close(self):
+        """ Waits for the queued frames to be saved and stops the workers. """
+        for _ in self.workers:
+            self.frames.put(None)
+        for worker in self.workers:
+            worker.join()
+        log("Frames {}".format(self.statistics()))
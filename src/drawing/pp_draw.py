@@ -1,6 +1,8 @@
 from src.drawing import stddraw
+from src.drawing.frame_writer import FrameWriter
+from src.drawing.video_exporter import VideoExporter
 from src.world_entities.environment import Environment
-from src.utilities import config, utilities
+from src.utilities import utilities
 from collections import defaultdict
 import numpy as np
 
@@ -13,6 +15,9 @@ class PathPlanningDrawer:
         self.height =  env.height
         self.borders = borders
         self.simulator = simulator
+        if not stddraw._windowCreated:
+            stddraw.setOffscreen(not simulator.config.plot_sim)   # a window only to watch the simulation
+            stddraw.setCanvasSize(simulator.config.draw_size, simulator.config.draw_size)
         stddraw.setXscale(0 - padding, self.width + padding)
         stddraw.setYscale(0 - padding, self.height + padding)
 
@@ -21,6 +26,13 @@ class PathPlanningDrawer:
 
         self.keep_indictor = defaultdict(list)  # list of couples (time stamp, drone)
 
+        # grid, borders, obstacles and targets rendered once, and the scenario they were rendered for
+        self.__static_layer = None
+        self.__static_scenario = None
+
+        self.frame_writer = None   # saves the frames in background, created at the first saved frame
+        self.video_exporter = None if simulator.config.video_export is None else VideoExporter(simulator.config.video_export, simulator.config.video_fps)
+
     def __channel_to_depot(self):
         stddraw.setPenColor(c=stddraw.LIGHT_GRAY)
         stddraw.setPenRadius(0.0025)
@@ -28,8 +40,25 @@ class PathPlanningDrawer:
         self.__reset_pen()
 
     def save(self, filename):
-        """ save the current plot """
-        stddraw.save(filename)
+        """ save the current plot, in background """
+        if self.frame_writer is None:
+            sim_config = self.simulator.config
+            self.frame_writer = FrameWriter(sim_config.save_plot_workers, sim_config.save_plot_queue, sim_config.save_plot_drop)
+        self.frame_writer.save(*stddraw.pixels(), filename)
+
+    def export(self, cur_step):
+        """ Appends the current plot to the exported video """
+        if self.video_exporter is not None:
+            self.video_exporter.write(stddraw.array(), cur_step)
+
+    def close(self):
+        """ Waits for the frames still to be saved, completes the exported video. """
+        if self.frame_writer is not None:
+            self.frame_writer.close()
+            self.frame_writer = None
+        if self.video_exporter is not None:
+            self.video_exporter.close()
+            self.video_exporter = None
 
     def borders_plot(self):
         stddraw.setPenColor(c=stddraw.RED)
@@ -58,6 +87,26 @@ class PathPlanningDrawer:
             stddraw.line(0, j, self.width, j)
         self.__reset_pen()
 
+    def draw_static_layer(self, target_coords):
+        """ Draws the parts of the scene that do not change during the simulation: grid, borders, obstacles and targets.
+        They are rendered once, then copied at every frame until the scenario changes. """
+        environment = self.simulator.environment
+        scenario = (self.simulator.grid_cell_size, environment.width, environment.height, self.simulator.config.draw_size,
+                    np.asarray(environment.obstacles_array).tobytes(), tuple(map(tuple, target_coords)))
+        if self.__static_layer is None or scenario != self.__static_scenario:
+            stddraw.clear()
+            self.grid_plot()
+            self.borders_plot()
+            self.draw_obstacles()
+            self.draw_target(target_coords)
+            self.__static_layer, self.__static_scenario = stddraw.layer(), scenario
+        else:
+            stddraw.drawLayer(self.__static_layer)
+
+    def invalidate_static_layer(self):
+        """ The static layer is rendered again at the next frame. """
+        self.__static_layer = None
+
     def __reset_pen(self):
         stddraw.setPenColor(c=stddraw.BLACK)
         stddraw.setPenRadius(0.0055)
@@ -95,7 +144,7 @@ class PathPlanningDrawer:
 
         self.__reset_pen()
 
-        if config.PLOT_TRAJECTORY_NEXT_TARGET and not self.simulator.is_free_movement():
+        if self.simulator.config.plot_trajectory_next_target and not self.simulator.is_free_movement():
             self.__draw_next_target(drone.coords, drone.next_target())
 
     def __validate_rew(self, drone, cur_step):
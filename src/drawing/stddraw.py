@@ -6,7 +6,6 @@ drawing.  A drawing appears on the canvas.  The canvas appears
 in the window.  As a convenience, the module also imports the
 commonly used Color objects defined in the color module.
 """
-from src.utilities import config
 import time
 import os
 import sys
@@ -15,16 +14,8 @@ import pygame.gfxdraw
 import pygame.font
 from . import color
 import string
+import collections
 
-if (sys.hexversion < 0x03000000):
-    import Tkinter
-    import tkMessageBox
-    import tkFileDialog
-else:
-	import tkinter as Tkinter
-	import tkinter.messagebox as tkMessageBox
-	import tkinter.filedialog as tkFileDialog
-	
 #-----------------------------------------------------------------------
 
 # Define colors so clients need not import the color module.
@@ -61,13 +52,16 @@ _DEFAULT_XMIN = 0.0
 _DEFAULT_XMAX = 1.0
 _DEFAULT_YMIN = 0.0
 _DEFAULT_YMAX = 1.0
-_DEFAULT_CANVAS_SIZE = config.DRAW_SIZE
+_DEFAULT_CANVAS_SIZE = 700
 _DEFAULT_PEN_RADIUS = .005  # Maybe change this to 0.0 in the future.
 _DEFAULT_PEN_COLOR = color.BLACK
 
 _DEFAULT_FONT_FAMILY = 'Helvetica'
 _DEFAULT_FONT_SIZE = 15
 
+_TEXT_CACHE_SIZE = 1024  # Rendered strings kept for reuse.
+_FULL_UPDATE_FRACTION = .5  # Above this fraction of changed canvas, flip it all.
+
 _xmin = None
 _ymin = None
 _xmax = None
@@ -85,6 +79,22 @@ _keysTyped = []
 # Has the window been created?
 _windowCreated = False
 
+# Draw in memory only, without opening a window?
+_offscreen = False
+
+# Fonts by (family, size), and the most recently rendered strings by
+# (string, color, family, size), least recently used first.
+_fonts = {}
+_textSurfaces = collections.OrderedDict()
+
+# The regions of the background canvas drawn since it was last cleared
+# (or covered with a layer), what it was cleared to, and the same for the
+# frame in the window: only the regions that differ are copied to it.
+_dirtyRects = []
+_canvasBase = None
+_shownRects = []
+_shownBase = None
+
 angle_plus = 0
 angle_minus = 0
 
@@ -168,12 +178,26 @@ def setCanvasSize(w=_DEFAULT_CANVAS_SIZE, h=_DEFAULT_CANVAS_SIZE):
 
     _canvasWidth = w
     _canvasHeight = h
-    _background = pygame.display.set_mode([w, h])
-    pygame.display.set_caption('stddraw window (r-click to save)')
+    if _offscreen:
+        _background = None
+    else:
+        _background = pygame.display.set_mode([w, h])
+        pygame.display.set_caption('stddraw window (r-click to save)')
     _surface = pygame.Surface((w, h))
     _surface.fill(_pygameColor(WHITE))
     _windowCreated = True
 
+def setOffscreen(offscreen=True):
+    """
+    Draw only on the background canvas in memory, never opening a
+    window, e.g. on machines without a display. Calling this function
+    is optional. If you call it, you must do so before setCanvasSize.
+    """
+    global _offscreen
+    if _windowCreated:
+        raise Exception('The stddraw window already was created')
+    _offscreen = offscreen
+
 def setXscale(min=_DEFAULT_XMIN, max=_DEFAULT_XMAX):
     """
     Set the x-scale of the canvas such that the minimum x value
@@ -215,7 +239,7 @@ def setPenRadius(r=_DEFAULT_PEN_RADIUS):
     r = float(r)
     if r < 0.0:
         raise Exception('Argument to setPenRadius() must be non-neg')
-    _penRadius = r * float(_DEFAULT_CANVAS_SIZE)
+    _penRadius = r * float(_canvasWidth)
 
 def setPenColor(c=_DEFAULT_PEN_COLOR):
     """
@@ -251,6 +275,22 @@ def _makeSureWindowCreated():
 
 # Functions to draw shapes, text, and images on the background canvas.
 
+def _markDirty(rect):
+    """
+    Record that the region rect of the background canvas changed.
+    """
+    if rect is not None:
+        _dirtyRects.append(pygame.Rect(rect))
+
+def _resetCanvas(base):
+    """
+    Record that the whole background canvas was covered by base, a
+    color or a layer.
+    """
+    global _canvasBase
+    _canvasBase = base
+    del _dirtyRects[:]
+
 def _pixel(x, y):
     """
     Draw on the background canvas a pixel at (x, y).
@@ -263,6 +303,7 @@ def _pixel(x, y):
         int(round(xs)),
         int(round(xy)),
         _pygameColor(_penColor))
+    _markDirty((int(round(xs)), int(round(xy)), 1, 1))
 
 def point(x, y):
     """
@@ -277,7 +318,7 @@ def point(x, y):
     else:
         xs = _scaleX(x)
         ys = _scaleY(y)
-        pygame.draw.ellipse(
+        _markDirty(pygame.draw.ellipse(
             _surface,
             _pygameColor(_penColor),
             pygame.Rect(
@@ -285,7 +326,7 @@ def point(x, y):
                 ys-_penRadius,
                 _penRadius*2.0,
                 _penRadius*2.0),
-            0)
+            0))
 
 def _thickLine(x0, y0, x1, y1, r):
     """
@@ -297,7 +338,7 @@ def _thickLine(x0, y0, x1, y1, r):
     xs1 = _scaleX(x1)
     ys1 = _scaleY(y1)
     if (abs(xs0-xs1) < 1.0) and (abs(ys0-ys1) < 1.0):
-        filledCircle(x0, y0, r)
+        _filledCircle(x0, y0, r)
         return
     xMid = (x0+x1)/2
     yMid = (y0+y1)/2
@@ -325,14 +366,19 @@ def line(x0, y0, x1, y1):
         y0s = _scaleY(y0)
         x1s = _scaleX(x1)
         y1s = _scaleY(y1)
-        pygame.draw.line(
+        _markDirty(pygame.draw.line(
             _surface,
             _pygameColor(_penColor),
             (x0s, y0s),
             (x1s, y1s),
-            int(round(lineWidth)))
+            int(round(lineWidth))))
     else:
-        _thickLine(x0, y0, x1, y1, _penRadius/_DEFAULT_CANVAS_SIZE)
+        _thickLine(x0, y0, x1, y1, _penRadius/_canvasWidth)
+        # One region for the whole line rather than one per dot.
+        r = _factorX(_penRadius/_canvasWidth) + 1
+        x0s, y0s, x1s, y1s = _scaleX(x0), _scaleY(y0), _scaleX(x1), _scaleY(y1)
+        _markDirty(pygame.Rect(min(x0s, x1s)-r, min(y0s, y1s)-r,
+                               abs(x1s-x0s)+2*r+1, abs(y1s-y0s)+2*r+1))
 
 def circle(x, y, r):
     """
@@ -351,11 +397,11 @@ def circle(x, y, r):
     else:
         xs = _scaleX(x)
         ys = _scaleY(y)
-        pygame.draw.ellipse(
+        _markDirty(pygame.draw.ellipse(
             _surface,
             _pygameColor(_penColor),
             pygame.Rect(xs-ws/2.0, ys-hs/2.0, ws, hs),
-            int(round(_penRadius)))
+            int(round(_penRadius))))
 
 def filledCircle(x, y, r):
     """
@@ -363,22 +409,28 @@ def filledCircle(x, y, r):
     centered on (x, y).
     """
     _makeSureWindowCreated()
+    _markDirty(_filledCircle(x, y, r))
+
+def _filledCircle(x, y, r):
+    """
+    Draw a filled circle as filledCircle does, return the region drawn.
+    """
     x = float(x)
     y = float(y)
     r = float(r)
     ws = _factorX(2.0*r)
     hs = _factorY(2.0*r)
     # If the radius is too small, then simply draw a pixel.
+    xs = _scaleX(x)
+    ys = _scaleY(y)
     if (ws <= 1.0) and (hs <= 1.0):
-        _pixel(x, y)
-    else:
-        xs = _scaleX(x)
-        ys = _scaleY(y)
-        pygame.draw.ellipse(
-            _surface,
-            _pygameColor(_penColor),
-            pygame.Rect(xs-ws/2.0, ys-hs/2.0, ws, hs),
-            0)
+        pygame.gfxdraw.pixel(_surface, int(round(xs)), int(round(ys)), _pygameColor(_penColor))
+        return pygame.Rect(int(round(xs)), int(round(ys)), 1, 1)
+    return pygame.draw.ellipse(
+        _surface,
+        _pygameColor(_penColor),
+        pygame.Rect(xs-ws/2.0, ys-hs/2.0, ws, hs),
+        0)
 
 def rectangle(x, y, w, h):
     """
@@ -399,11 +451,11 @@ def rectangle(x, y, w, h):
     else:
         xs = _scaleX(x)
         ys = _scaleY(y)
-        pygame.draw.rect(
+        _markDirty(pygame.draw.rect(
             _surface,
             _pygameColor(_penColor),
             pygame.Rect(xs, ys-hs, ws, hs),
-            int(round(_penRadius)))
+            int(round(_penRadius))))
 
 def filledRectangle(x, y, w, h):
     """
@@ -424,11 +476,11 @@ def filledRectangle(x, y, w, h):
     else:
         xs = _scaleX(x)
         ys = _scaleY(y)
-        pygame.draw.rect(
+        _markDirty(pygame.draw.rect(
             _surface,
             _pygameColor(_penColor),
             pygame.Rect(xs, ys-hs, ws, hs),
-            0)
+            0))
 
 def square(x, y, r):
     """
@@ -464,11 +516,11 @@ def polygon(x, y):
     for i in range(len(x)):
         points.append((xScaled[i], yScaled[i]))
     points.append((xScaled[0], yScaled[0]))
-    pygame.draw.polygon(
+    _markDirty(pygame.draw.polygon(
         _surface,
         _pygameColor(_penColor),
         points,
-        int(round(_penRadius)))
+        int(round(_penRadius))))
 
 def filledPolygon(x, y):
     """
@@ -488,7 +540,7 @@ def filledPolygon(x, y):
     for i in range(len(x)):
         points.append((xScaled[i], yScaled[i]))
     points.append((xScaled[0], yScaled[0]))
-    pygame.draw.polygon(_surface, _pygameColor(_penColor), points, 0)
+    _markDirty(pygame.draw.polygon(_surface, _pygameColor(_penColor), points, 0))
 
 def text(x, y, s):
     """
@@ -499,10 +551,34 @@ def text(x, y, s):
     y = float(y)
     xs = _scaleX(x)
     ys = _scaleY(y)
-    font = pygame.font.SysFont(_fontFamily, _fontSize)
-    text = font.render(s, 1, _pygameColor(_penColor))
+    text = _renderedText(s)
     textpos = text.get_rect(center=(xs, ys))
-    _surface.blit(text, textpos)
+    _markDirty(_surface.blit(text, textpos))
+
+def _font():
+    """
+    Return the font of the current family and size, loaded once.
+    """
+    key = (_fontFamily, _fontSize)
+    if key not in _fonts:
+        _fonts[key] = pygame.font.SysFont(_fontFamily, _fontSize)
+    return _fonts[key]
+
+def _renderedText(s):
+    """
+    Return the surface of string s in the current pen color and font,
+    rendered once and then reused while among the _TEXT_CACHE_SIZE most
+    recently drawn strings.
+    """
+    key = (s, _penColor.getRed(), _penColor.getGreen(), _penColor.getBlue(), _fontFamily, _fontSize)
+    if key in _textSurfaces:
+        _textSurfaces.move_to_end(key)
+        return _textSurfaces[key]
+    text = _font().render(s, 1, _pygameColor(_penColor))
+    _textSurfaces[key] = text
+    if len(_textSurfaces) > _TEXT_CACHE_SIZE:
+        _textSurfaces.popitem(last=False)
+    return text
 
 def picture(pic, x=None, y=None):
     """
@@ -524,7 +600,7 @@ def picture(pic, x=None, y=None):
     ws = pic.width()
     hs = pic.height()
     picSurface = pic._surface # violates encapsulation
-    _surface.blit(picSurface, [xs-ws/2.0, ys-hs/2.0, ws, hs])
+    _markDirty(_surface.blit(picSurface, [xs-ws/2.0, ys-hs/2.0, ws, hs]))
 
 def clear(c=WHITE):
     """
@@ -533,6 +609,40 @@ def clear(c=WHITE):
     """
     _makeSureWindowCreated()
     _surface.fill(_pygameColor(c))
+    _resetCanvas((c.getRed(), c.getGreen(), c.getBlue()))
+
+def layer():
+    """
+    Return a copy of the background canvas as it is now, to draw it again
+    later with drawLayer.
+    """
+    _makeSureWindowCreated()
+    return _surface.copy()
+
+def drawLayer(surface):
+    """
+    Draw on the background canvas a layer returned by layer().
+    """
+    _makeSureWindowCreated()
+    _surface.blit(surface, (0, 0))
+    _resetCanvas(surface)
+
+def array():
+    """
+    Return the background canvas as a NumPy array of RGB pixels, of
+    shape (height, width, 3).
+    """
+    import pygame.surfarray
+    _makeSureWindowCreated()
+    return pygame.surfarray.array3d(_surface).swapaxes(0, 1)
+
+def pixels():
+    """
+    Return the background canvas as raw RGB bytes, row by row from the
+    top, and its size (width, height).
+    """
+    _makeSureWindowCreated()
+    return pygame.image.tobytes(_surface, "RGB"), _surface.get_size()
 
 def save(f):
     """
@@ -558,8 +668,22 @@ def _show(simulator):
     """
     Copy the background canvas to the window canvas.
     """
-    _background.blit(_surface, (0, 0))
-    pygame.display.flip()
+    global _shownRects
+    global _shownBase
+    # The window changes where this frame draws and where the last one did,
+    # unless the canvas was cleared to something else.
+    rects = _shownRects + _dirtyRects
+    changedArea = sum(rect.width * rect.height for rect in rects)
+    if (_canvasBase is None) or (_canvasBase != _shownBase) \
+            or (changedArea > _FULL_UPDATE_FRACTION * _canvasWidth * _canvasHeight):
+        _background.blit(_surface, (0, 0))
+        pygame.display.flip()
+    else:
+        for rect in rects:
+            _background.blit(_surface, rect, rect)
+        pygame.display.update(rects)
+    _shownRects = list(_dirtyRects)
+    _shownBase = _canvasBase
     _checkForEvents(simulator)
 
 def _showAndWaitForever(simulator):
@@ -579,6 +703,9 @@ def show(simulator, msec=float('inf')):
     Copy the background canvas to the window canvas, and
     then wait for msec milliseconds. msec defaults to infinity.
     """
+    if _offscreen:
+        return
+
     if msec == float('inf'):
         _showAndWaitForever(simulator)
 
@@ -773,10 +900,26 @@ pygame.font.init()
 
 # Functions for displaying Tkinter dialog boxes in child processes.
 
+def _importTkinter():
+    """
+    Import and return the Tkinter modules. They are needed only by the
+    dialog boxes, so they are not imported with stddraw.
+    """
+    if (sys.hexversion < 0x03000000):
+        import Tkinter
+        import tkMessageBox
+        import tkFileDialog
+    else:
+        import tkinter as Tkinter
+        import tkinter.messagebox as tkMessageBox
+        import tkinter.filedialog as tkFileDialog
+    return Tkinter, tkMessageBox, tkFileDialog
+
 def _getFileName():
     """
     Display a dialog box that asks the user for a file name.
     """
+    Tkinter, tkMessageBox, tkFileDialog = _importTkinter()
     root = Tkinter.Tk()
     root.withdraw()
     reply = tkFileDialog.asksaveasfilename(initialdir='.')
@@ -788,6 +931,7 @@ def _confirmFileSave():
     """
     Display a dialog box that confirms a file save operation.
     """
+    Tkinter, tkMessageBox, tkFileDialog = _importTkinter()
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showinfo(title='File Save Confirmation',
@@ -799,6 +943,7 @@ def _reportFileSaveError(msg):
     Display a dialog box that reports a msg.  msg is a string which
     describes an error in a file save operation.
     """
+    Tkinter, tkMessageBox, tkFileDialog = _importTkinter()
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showerror(title='File Save Error', message=msg)
@@ -0,0 +1,56 @@
+from src.utilities.utilities import make_path
+
+import io
+import shutil
+import subprocess
+import zipfile
+import numpy as np
+
+
+class VideoExporter:
+    """ Streams the frames of the simulation, as (height, width, 3) RGB arrays, into a single file:
+        - a video, encoded by ffmpeg as the frames arrive, for any extension but .npz (e.g. .mp4);
+        - a compressed archive of the frames, for .npz, to read with numpy.load(path)["frame_<step>"].
+    Nothing is kept in memory but the frame being written. """
+
+    def __init__(self, path, fps=30):
+        self.path, self.fps = path, fps
+        self.n_frames = 0
+        self.__archive = None
+        self.__encoder = None
+        make_path(path)
+
+        if path.endswith(".npz"):
+            self.__archive = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+        elif shutil.which("ffmpeg") is None:
+            raise Exception("ffmpeg is needed to export the video {}, or export the frames to a .npz archive".format(path))
+
+    def __start_encoder(self, height, width):
+        # yuv420p, the most widely playable format, needs even sides
+        self.__encoder = subprocess.Popen(["ffmpeg", "-y", "-loglevel", "error",
+                                           "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "{}x{}".format(width, height),
+                                           "-r", str(self.fps), "-i", "-",
+                                           "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", self.path],
+                                          stdin=subprocess.PIPE)
+
+    def write(self, frame, step=None):
+        """ Appends the frame, named after its step in the archive. """
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if self.__archive is not None:
+            data = io.BytesIO()
+            np.lib.format.write_array(data, frame)
+            self.__archive.writestr("frame_{}.npy".format(self.n_frames if step is None else step), data.getvalue())
+        else:
+            if self.__encoder is None:
+                self.__start_encoder(*frame.shape[:2])
+            self.__encoder.stdin.write(frame.tobytes())
+        self.n_frames += 1
+
+    def close(self):
+        """ Completes the file. """
+        if self.__archive is not None:
+            self.__archive.close()
+        if self.__encoder is not None:
+            self.__encoder.stdin.close()
+            if self.__encoder.wait() != 0:
+                raise Exception("ffmpeg could not encode the video {}".format(self.path))
@@ -0,0 +1,83 @@
+from src.utilities import config
+from src.utilities.utilities import log, make_path
+
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+
+def parameters_grid(grid: dict):
+    """ Given a dictionary {Simulator constructor argument: list of values}, returns the list of all the
+    combinations of the values, as dictionaries of constructor arguments. """
+    arguments = sorted(grid.keys())
+    return [dict(zip(arguments, values)) for values in itertools.product(*[grid[arg] for arg in arguments])]
+
+
+def run_key(parameters: dict):
+    """ Identifies a run of the campaign by its constructor arguments. """
+    return json.dumps(parameters, sort_keys=True)
+
+
+def run_simulation(parameters: dict):
+    """ Runs one headless simulation with the given constructor arguments, returns its results. """
+    from src.simulation.simulator import Simulator
+    from src.utilities.config import SimulationConfig
+
+    start = time.time()
+    try:
+        sim = Simulator(SimulationConfig().replace(**parameters).headless())   # workers never draw nor write outputs
+        try:
+            sim.run()
+            result = {"metrics": sim.metrics()}
+        finally:
+            sim.close()
+    except Exception as e:
+        result = {"error": repr(e)}
+
+    result.update({"parameters": parameters, "wall_time_sec": time.time() - start})
+    return result
+
+
+class Campaign:
+    """ An experimental campaign: one simulation per combination of the Simulator constructor arguments in the grid.
+    The simulations run in a pool of processes and the results of every run are appended, as soon as the run
+    finishes, to a single JSON lines file. The campaign is resumable: runs already in the file are skipped. """
+
+    def __init__(self, grid: dict, name: str, n_processes=None):
+        self.grid = grid
+        self.out_file = config.EXPERIMENTS_DIR + name + ".jsonl"
+        self.n_processes = config.CAMPAIGN_PROCESSES if n_processes is None else n_processes
+
+    def finished_runs(self):
+        """ Returns the keys of the runs that completed without errors in a previous execution of the campaign. """
+        finished = set()
+        if os.path.exists(self.out_file):
+            with open(self.out_file, "r") as in_file:
+                for line in in_file:
+                    result = json.loads(line)
+                    if "error" not in result:
+                        finished.add(run_key(result["parameters"]))
+        return finished
+
+    def pending_runs(self):
+        finished = self.finished_runs()
+        return [parameters for parameters in parameters_grid(self.grid) if run_key(parameters) not in finished]
+
+    def run(self):
+        """ Runs all the pending simulations of the campaign, on all the cores by default. """
+        pending = self.pending_runs()
+        log("Campaign {}: {} runs to do.".format(self.out_file, len(pending)))
+
+        make_path(self.out_file)
+        with open(self.out_file, "a") as out_file, multiprocessing.Pool(self.n_processes) as pool:
+            for i, result in enumerate(pool.imap_unordered(run_simulation, pending)):
+                out_file.write(json.dumps(result) + "\n")
+                out_file.flush()
+                log("Campaign {}: run {}/{} done {}".format(self.out_file, i + 1, len(pending), result.get("error", "")))
+
+    def results(self):
+        """ Returns the results of all the runs in the output file. """
+        with open(self.out_file, "r") as in_file:
+            return [json.loads(line) for line in in_file]
@@ -0,0 +1,133 @@
+from src.utilities.utilities import COLLISION_DISTANCE, collision_reach
+
+import heapq
+import numpy as np
+
+
+class FastForwardScheduler:
+    """ Discrete event scheduling of the waypoint-following drones (tour mode).
+
+    Between two events a drone flies in a straight line at constant speed: it does not switch waypoint and it is too
+    far from every obstacle to collide. Each drone is thus stepped only at its own events, namely when it is about
+    to reach its next waypoint or when it may be close enough to an obstacle, and it keeps a leg (leg_step, leg_coords,
+    velocity) from which its state after any step up to the next event is interpolated. The state of the swarm is
+    materialized only when asked by advance_to, e.g. for plotting or metrics.
+
+    The run is not bit-exact with the stepped one: positions interpolated along a leg differ by about an ulp from
+    those accumulated step by step, which is enough to switch waypoint one step earlier or later when a drone reaches
+    it exactly at the end of a step. From there on the drone is a step ahead or behind on its tour (some meters), so
+    long runs with many drones give close but not identical trajectories, collisions and coverage.
+    """
+
+    def __init__(self, simulator, track_path=False):
+        self.simulator = simulator
+        self.swarm = simulator.swarm
+        self.environment = simulator.environment
+
+        n_drones = len(self.swarm)
+        self.leg_step = np.full(n_drones, -1)                  # step after which the drone was at leg_coords
+        self.leg_coords = self.swarm.coords.copy()
+        self.leg_previous_coords = self.swarm.previous_coords.copy()
+        self.velocity = np.zeros((n_drones, 2))                # meters per step along the leg
+        self.clear_leg = np.zeros(n_drones, dtype=bool)        # no obstacle within a step from the leg
+        self.next_event = np.zeros(n_drones, dtype=int)        # next step at which the drone is stepped
+
+        self.events = [(0, i) for i in range(n_drones)]        # heap of (step, drone index)
+        heapq.heapify(self.events)
+        self.cur_step = -1                                     # the swarm arrays hold the state after this step
+
+        # if track_path, the legs started since the last call to path: (drone indices, step, coords, previous, velocity)
+        self.track_path = track_path
+        self.legs = [(np.arange(n_drones), self.leg_step.copy(), self.leg_coords.copy(), self.leg_previous_coords.copy(), self.velocity.copy())]
+
+    def next_event_step(self):
+        """ Returns the step of the next event, inf if there are none. """
+        return self.events[0][0] if len(self.events) > 0 else np.inf
+
+    def advance_to(self, step):
+        """ Processes all the events up to step, then writes the state of all the drones after step in the swarm. """
+        while len(self.events) > 0 and self.events[0][0] <= step:
+            event_step, indices = self.events[0][0], []
+            while len(self.events) > 0 and self.events[0][0] == event_step:
+                indices.append(heapq.heappop(self.events)[1])
+            self.__process(np.array(indices), event_step)
+
+        self.__interpolate(np.arange(len(self.swarm)), step)
+        self.cur_step = step
+
+    def __interpolate(self, indices, step):
+        """ Writes in the swarm the state after step of the drones in indices, along their current leg. """
+        elapsed = (step - self.leg_step[indices])[:, None]
+        coords = self.leg_coords[indices] + elapsed * self.velocity[indices]
+        moved = elapsed > 0
+        self.swarm.previous_coords[indices] = np.where(moved, coords - self.velocity[indices], self.leg_previous_coords[indices])
+        self.swarm.coords[indices] = coords
+
+    def path(self, first_step, last_step):
+        """ The segments previous_coords -> coords travelled by all the drones in every step from first_step to
+        last_step, up to the current step and as two (steps, drones, 2) arrays, interpolated along the tracked legs.
+        The legs before last_step are forgotten once it gets to the current step. """
+        indices, leg_steps, coords, previous, velocity = [np.concatenate(leg) for leg in zip(*self.legs)]
+        stride = self.cur_step + 2
+        keys = indices * stride + leg_steps + 1
+        order = np.argsort(keys, kind="stable")
+
+        # the leg flown in every step by every drone is the last one started by then
+        steps = np.arange(first_step, last_step + 1)[:, None]
+        legs = order[np.searchsorted(keys[order], np.arange(len(self.swarm))[None, :] * stride + steps + 1, side="right") - 1]
+        elapsed = (steps - leg_steps[legs])[..., None]
+        ends = coords[legs] + elapsed * velocity[legs]
+        starts = np.where(elapsed > 0, ends - velocity[legs], previous[legs])
+
+        if last_step >= self.cur_step:
+            last = legs[-1]
+            self.legs = [(indices[last], leg_steps[last], coords[last], previous[last], velocity[last])]
+        return starts, ends
+
+    def __process(self, indices, step):
+        """ Regular step for the drones in indices, then plans their next leg. """
+        self.__interpolate(indices, step - 1)
+
+        # the drones that reached this event flying a clear leg cannot have collided
+        unchecked = indices[~self.clear_leg[indices]]
+        if len(unchecked) > 0:
+            self.environment.detect_collisions([self.swarm.drones[i] for i in unchecked])
+        self.swarm.move(indices)
+
+        # the new leg starts from the state after this step, heading towards the current waypoint
+        coords = self.swarm.coords[indices]
+        distance_travelled = self.swarm.speed[indices] * self.simulator.ts_duration_sec
+        delta = self.swarm.next_targets(indices) - coords
+        distance = np.hypot(delta[:, 0], delta[:, 1])
+
+        moving = distance_travelled > 0
+        step_length = np.where(moving, distance_travelled, 1)
+        velocity = np.where(moving[:, None], delta * (step_length / np.where(distance > 0, distance, 1))[:, None], 0)
+
+        # the drone moves on without switching waypoint while the waypoint is farther than a step ...
+        no_switch_steps = np.maximum(np.ceil(distance / step_length) - 1, 0)
+
+        # ... and it cannot collide while it keeps out of its collision reach from the obstacles, either along the
+        # whole leg (up to the position of the next event) or, by conservative advancement, for as many steps as its
+        # distance from the closest obstacle allows
+        leg_end = coords + no_switch_steps[:, None] * velocity
+        reach = collision_reach(step_length)
+        clear_leg = moving & (self.environment.obstacles_clearance(coords, 2 * reach, leg_end) > reach)
+
+        bulk_steps = np.where(clear_leg, no_switch_steps, 0)
+        near = np.nonzero(moving & ~clear_leg)[0]
+        if len(near) > 0:
+            clearance = self.environment.obstacles_clearance(coords[near], distance[near] + step_length[near])
+            bulk_steps[near] = np.maximum(np.minimum(no_switch_steps[near], np.ceil((clearance - COLLISION_DISTANCE) / step_length[near]) - 1), 0)
+
+        self.leg_step[indices] = step
+        self.leg_coords[indices] = coords
+        self.leg_previous_coords[indices] = self.swarm.previous_coords[indices]
+        self.velocity[indices] = velocity
+        self.clear_leg[indices] = clear_leg
+        self.next_event[indices] = step + 1 + bulk_steps.astype(int)
+        if self.track_path:
+            self.legs.append((indices, np.full(len(indices), step), coords, self.leg_previous_coords[indices], velocity))
+
+        for i, next_step in zip(indices.tolist(), self.next_event[indices].tolist()):
+            heapq.heappush(self.events, (next_step, i))
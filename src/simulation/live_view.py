@@ -0,0 +1,162 @@
+""" Live view of a running simulation from another process.
+
+A simulator with LIVE_VIEW publishes the state of the drones every SKIP_SIM_STEP steps into a ring of frames in
+shared memory, and goes on without waiting for anyone. A viewer attaches to the ring by name, at any time, and draws
+the most recent frame at its own frame rate, skipping those it was too slow to draw:
+
+    python -m src.simulation.live_view <name printed by the simulator> [fps]
+
+The viewer rebuilds the same scenario (obstacles, tours, targets) from the configuration stored in the ring, and only
+the state of the drones travels through the frames. Closing the viewer does not affect the simulation.
+"""
+from src.utilities.config import SimulationConfig
+
+from multiprocessing import shared_memory, resource_tracker
+import dataclasses
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+
+_HEADER = 8       # int64 fields: capacity, n drones, frames written, finished, configuration bytes
+_CAPACITY = 8     # frames in the ring
+_FIELDS = 5       # float64 per drone in a frame: x, y, waypoint, speed, angle
+
+_publishers = itertools.count()   # rings created by this process, to name them uniquely
+
+
+class FramesRing:
+    """ Ring of frames in shared memory, one writer and any number of readers. Every frame has a sequence number,
+    odd while the writer is filling it, so that a reader detects and discards the frames overwritten while read. """
+
+    def __init__(self, memory, owner):
+        self.memory, self.owner = memory, owner
+        self.header = np.ndarray((_HEADER,), dtype=np.int64, buffer=memory.buf)
+        self.capacity, self.n_drones, config_bytes = int(self.header[0]), int(self.header[1]), int(self.header[4])
+
+        config_start = _HEADER * 8
+        self.config_json = bytes(memory.buf[config_start:config_start + config_bytes]).decode()
+        frames_start = config_start + _padded(config_bytes)
+        frame_size = 2 + self.n_drones * _FIELDS
+        self.frames = np.ndarray((self.capacity, frame_size), dtype=np.float64, buffer=memory.buf, offset=frames_start)
+
+    @staticmethod
+    def create(name, sim_config, n_drones):
+        """ Creates the ring of a simulation, with its configuration. """
+        config_json = json.dumps(dataclasses.asdict(sim_config)).encode()
+        size = _HEADER * 8 + _padded(len(config_json)) + _CAPACITY * (2 + n_drones * _FIELDS) * 8
+        memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((_HEADER,), dtype=np.int64, buffer=memory.buf)
+        header[:] = 0
+        header[0], header[1], header[4] = _CAPACITY, n_drones, len(config_json)
+        memory.buf[_HEADER * 8:_HEADER * 8 + len(config_json)] = config_json
+        del header
+        return FramesRing(memory, owner=True)
+
+    @staticmethod
+    def attach(name):
+        """ Attaches to the ring of a running simulation. """
+        memory = shared_memory.SharedMemory(name=name)
+        # the ring belongs to the simulation: the viewer must not remove it when it exits
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return FramesRing(memory, owner=False)
+
+    def config(self):
+        return SimulationConfig(**json.loads(self.config_json))
+
+    def publish(self, step, coords, waypoints, speed, angle):
+        """ Writes the state of the drones at step in the next frame. """
+        written = int(self.header[2])
+        frame = self.frames[written % self.capacity]
+        frame[0] += 1   # odd: being written
+        frame[2:].reshape(self.n_drones, _FIELDS)[:] = np.column_stack([coords, waypoints, speed, angle])
+        frame[1] = step
+        frame[0] += 1
+        self.header[2] = written + 1
+
+    def latest(self):
+        """ Returns (step, state of the drones as (n_drones, 5) x, y, waypoint, speed, angle) of the last complete
+        frame, or None if there is none yet. """
+        written = int(self.header[2])
+        for back in range(1, min(written, self.capacity) + 1):
+            frame = self.frames[(written - back) % self.capacity]
+            sequence = frame[0]
+            if sequence % 2 == 1:
+                continue
+            step, state = int(frame[1]), frame[2:].reshape(self.n_drones, _FIELDS).copy()
+            if frame[0] == sequence:
+                return step, state
+        return None
+
+    def finish(self):
+        self.header[3] = 1
+
+    def is_finished(self):
+        return bool(self.header[3])
+
+    def close(self):
+        """ Detaches from the ring, the simulation also removes it. """
+        del self.header, self.frames
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def _padded(n_bytes):
+    return (n_bytes + 7) // 8 * 8
+
+
+class LivePublisher:
+    """ The side of the simulator: publishes its state in a new ring, named after the process, a counter and the seed. """
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.name = "dronesim-{}-{}-{}".format(os.getpid(), next(_publishers), simulator.sim_seed)
+        self.ring = FramesRing.create(self.name, simulator.config, simulator.n_drones)
+
+    def publish(self):
+        swarm, drones = self.simulator.swarm, self.simulator.environment.drones
+        if swarm is not None:
+            coords, waypoints, speed, angle = swarm.coords, swarm.current_waypoint_count, swarm.speed, swarm.angle
+        else:
+            coords = np.array([np.asarray(drone.coords, dtype=float) for drone in drones]).reshape(-1, 2)
+            waypoints = [drone.current_waypoint_count for drone in drones]
+            speed, angle = [drone.speed for drone in drones], [drone.angle for drone in drones]
+        self.ring.publish(self.simulator.cur_step, coords, waypoints, speed, angle)
+
+    def close(self):
+        self.ring.finish()
+        self.ring.close()
+
+
+def view(name, fps=30):
+    """ Draws the frames of the running simulation name, until it ends or the window is closed. """
+    from src.simulation.simulator import Simulator
+
+    ring = FramesRing.attach(name)
+    sim_config = ring.config().headless().replace(plot_sim=True, skip_sim_step=1, wait_sim_step=0)
+    simulator = Simulator(sim_config)
+    drones = simulator.environment.drones
+
+    last_step = None
+    try:
+        while not ring.is_finished():
+            started = time.time()
+            frame = ring.latest()
+            if frame is not None and frame[0] != last_step:
+                last_step, state = frame
+                for drone, (x, y, waypoint, speed, angle) in zip(drones, state):
+                    drone.coords = np.array([x, y])
+                    drone.current_waypoint_count, drone.speed, drone.angle = int(waypoint), speed, angle
+                simulator.cur_step = last_step
+                simulator.draw(last_step)
+            time.sleep(max(0, 1 / fps - (time.time() - started)))
+    finally:
+        ring.close()
+
+
+if __name__ == "__main__":
+    view(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 30)
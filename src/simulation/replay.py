@@ -0,0 +1,122 @@
+""" Replay of a simulation from the trajectories it recorded (TRAJECTORY_DIR), with no need to run it again.
+
+    python -m src.simulation.replay <trace directory> [start step] [speed] [skip]
+
+plays the trace from start step, speed times faster than the simulated time, drawing one recorded step every skip
+steps. When drawing cannot keep up with the speed, the late frames are skipped. While playing, the keys are:
+space pauses and resumes, + and - double and halve the speed, . and , move one frame forward and back, ] and [ jump
+a tenth of the trace forward and back.
+
+The replay rebuilds the same scenario (obstacles, tours, targets) from the configuration stored in the trace, and
+only the records of the drawn steps are read from the memory-mapped chunks of the trace.
+"""
+from src.utilities.config import SimulationConfig
+from src.utilities.trajectory import TrajectoryTrace
+
+import sys
+import time
+import numpy as np
+
+
+class RecordedBuffer:
+    """ Buffer of a replayed drone, of which only the length is recorded. """
+
+    def __init__(self, length=0):
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+
+class Replay:
+    """ Draws the recorded steps of a trace through the PathPlanningDrawer of a simulator that is never run. The
+    keyword parameters change the configuration of the drawing simulator, e.g. plot_sim=False, video_export="a.mp4"
+    to export the replay instead of showing it. """
+
+    def __init__(self, directory, **parameters):
+        from src.simulation.simulator import Simulator
+
+        self.trace = TrajectoryTrace(directory)
+        # the outputs of the recorded run are never reopened, the replay writes only those given in parameters
+        parameters = dict(dict(plot_sim=True, events_process=None, swarm_engine=False, fast_forward=False, tours_timeline=False,
+                               skip_sim_step=1, wait_sim_step=0), **parameters)
+        self.simulator = Simulator(SimulationConfig(**self.trace.config).headless().replace(**parameters))
+        self.drones = self.simulator.environment.drones
+        self.cur_step = None
+
+    def seek(self, step):
+        """ Sets the drones in their state at step, or at the last recorded step before it, returns that step. """
+        record = self.trace.at_step(step)
+        for i, drone in enumerate(self.drones):
+            drone.coords = np.array(record["coords"][i], dtype=float)
+            drone.angle, drone.speed = float(record["angle"][i]), float(record["speed"][i])
+            drone.current_waypoint_count = int(record["waypoint"][i])
+            drone.buffer = RecordedBuffer(int(record["buffer"][i]))
+        self.cur_step = self.simulator.cur_step = int(record["step"])
+        return self.cur_step
+
+    def draw(self, step):
+        """ Draws the state of the drones at step. """
+        self.simulator.draw(self.seek(step))
+
+    def play(self, start_step=None, stop_step=None, speed=1., skip=1):
+        """ Draws the steps from start_step to stop_step (the whole trace by default), one every skip steps, speed
+        times faster than the simulated time, or as fast as possible if speed is None. """
+        from src.drawing import stddraw
+
+        first_step = self.trace.first_step()
+        stop_step = self.trace.last_step() if stop_step is None else min(stop_step, self.trace.last_step())
+        stride = max(1, round(skip / self.trace.decimation)) * self.trace.decimation
+        jump = max(stride, (stop_step - first_step) // 10 // stride * stride)
+
+        step = first_step if start_step is None else max(start_step, first_step)
+        paused = False
+        anchor = (time.time(), step)   # a step and the wall clock time it was drawn, pace the steps after it
+        while step <= stop_step:
+            self.draw(step)
+
+            moved, changed = False, False
+            while self.simulator.config.plot_sim:
+                while stddraw.hasNextKeyTyped():
+                    key = stddraw.nextKeyTyped()
+                    changed = True
+                    if key == " ":
+                        paused = not paused
+                    elif key == "+" and speed is not None:
+                        speed *= 2
+                    elif key == "-" and speed is not None:
+                        speed /= 2
+                    elif key in [".", ",", "]", "["]:
+                        move = stride if key in [".", ","] else jump
+                        step = min(max(step + (move if key in [".", "]"] else -move), first_step), stop_step)
+                        moved = True
+                if moved or not paused:
+                    break
+                time.sleep(.05)
+                stddraw._checkForEvents(self.simulator)
+            if changed:
+                anchor = (time.time(), step)
+            if moved:
+                continue
+
+            step += stride
+            if speed is not None:
+                due = anchor[0] + (step - anchor[1]) * self.simulator.ts_duration_sec / speed
+                late = time.time() - due
+                if late < 0:
+                    time.sleep(-late)
+                else:   # skip the frames there is no time to draw
+                    step += int(late * speed / self.simulator.ts_duration_sec) // stride * stride
+
+    def close(self):
+        self.simulator.close()
+
+
+if __name__ == "__main__":
+    replay = Replay(sys.argv[1])
+    try:
+        replay.play(start_step=int(sys.argv[2]) if len(sys.argv) > 2 else None,
+                    speed=float(sys.argv[3]) if len(sys.argv) > 3 else 1.,
+                    skip=int(sys.argv[4]) if len(sys.argv) > 4 else 1)
+    finally:
+        replay.close()
@@ -0,0 +1,87 @@
+from src.simulation.simulator import Simulator
+from src.utilities.config import SimulationConfig
+from src.world_entities.swarm import SwarmKinematics
+from src.utilities.tours_timeline import ToursTimeline
+from src.utilities.spatial_index import ObstaclesGrid
+from src.utilities.utilities import swept_segments_collisions, collision_reach
+
+import numpy as np
+
+
+class ReplicatedSimulator:
+    """ Independent replicas of the same scenario that differ only by their seed, hence by their obstacles and tours,
+    simulated as a single vectorized state. The drones of all the replicas live in one SwarmKinematics, whose arrays
+    have an extra replica dimension through the views coords, previous_coords, angle, speed (n_replicas, n_drones, ...),
+    so that movement and collisions of all the replicas are computed in the same NumPy calls.
+
+    For the collision check the replicas are laid side by side along x, stride meters apart, so that the obstacles
+    of all of them go in one spatial index and no drone can reach the obstacles of another replica. """
+
+    def __init__(self, seeds: list, sim_config=None, **parameters):
+        self.config = (SimulationConfig() if sim_config is None else sim_config).replace(**parameters)
+
+        # each replica is a plain headless simulator, the batched swarm below replaces their own kinematics
+        replica_config = self.config.headless().replace(swarm_engine=False, fast_forward=False, tours_timeline=False)
+        self.replicas = [Simulator(replica_config, sim_seed=seed) for seed in seeds]
+        self.n_replicas, self.n_drones = len(self.replicas), self.config.n_drones
+        self.cur_step = 0
+
+        self.drones = [drone for replica in self.replicas for drone in replica.environment.drones]
+        timeline = None
+        if self.config.tours_timeline and not self.replicas[0].is_free_movement():
+            timeline = ToursTimeline([drone.path for drone in self.drones], [drone.speed for drone in self.drones], self.config.ts_duration_sec)
+        self.swarm = SwarmKinematics(self.drones, self.replicas[0], timeline)
+
+        # views of the swarm state with the replica dimension first
+        self.coords = self.swarm.coords.reshape(self.n_replicas, self.n_drones, 2)
+        self.previous_coords = self.swarm.previous_coords.reshape(self.n_replicas, self.n_drones, 2)
+        self.angle = self.swarm.angle.reshape(self.n_replicas, self.n_drones)
+        self.speed = self.swarm.speed.reshape(self.n_replicas, self.n_drones)
+
+        self.__setup_obstacles()
+
+    def __setup_obstacles(self):
+        """ Lays the obstacles of the replicas side by side and indexes them all together. """
+        obstacles = [replica.environment.obstacles_array for replica in self.replicas]
+        x_coords = np.concatenate([[0, self.config.env_width_meters]] + [obs[:, [0, 2]].ravel() for obs in obstacles])
+        self.stride = (x_coords.max() - x_coords.min()) + self.config.env_width_meters + self.config.env_height_meters
+
+        shifts = np.arange(self.n_replicas) * self.stride
+        self.obstacles = np.concatenate([obs + [shift, 0, shift, 0] for obs, shift in zip(obstacles, shifts)])
+        self.drones_shift = np.repeat(shifts, self.n_drones)[:, None] * [1, 0]
+
+        cell_size = self.config.obstacles_cell_size
+        self.obstacles_index = ObstaclesGrid(self.obstacles, cell_size) if cell_size > 0 and len(self.obstacles) > 0 else None
+
+    def detect_collisions(self):
+        """ Detects the collisions happened in the previous step for the drones of all the replicas, in one pass. """
+        if len(self.obstacles) == 0:
+            return
+
+        starts, ends = self.swarm.previous_coords + self.drones_shift, self.swarm.coords + self.drones_shift
+        distance_travelled = self.swarm.speed * self.config.ts_duration_sec
+
+        candidates = None
+        if self.obstacles_index is not None:
+            candidates = self.obstacles_index.candidates(ends, collision_reach(distance_travelled))
+
+        for index in swept_segments_collisions(self.obstacles, starts, ends, distance_travelled, candidates):
+            self.replicas[index // self.n_drones].environment.handle_collision(self.drones[index])
+
+    def run(self):
+        """ Runs all the replicas, one batched step at a time. """
+        for cur_step in range(self.config.sim_duration_ts):
+            self.cur_step = cur_step
+            for replica in self.replicas:
+                replica.cur_step = cur_step
+
+            self.detect_collisions()
+            self.swarm.move()
+
+    def metrics(self):
+        """ Returns the metrics of every replica, by seed. """
+        return {replica.sim_seed: replica.metrics() for replica in self.replicas}
+
+    def close(self):
+        for replica in self.replicas:
+            replica.close()
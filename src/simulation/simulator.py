@@ -2,65 +2,65 @@
 from src.world_entities.environment import Environment
 from src.world_entities.base_station import BaseStation
 from src.world_entities.drone import Drone
+from src.world_entities.swarm import SwarmKinematics
+from src.simulation.fast_forward import FastForwardScheduler
+from src.utilities.tours_timeline import ToursTimeline
 
-from src.utilities.utilities import PathManager, current_date, euclidean_distance
+from src.utilities.utilities import PathManager, EventGenerator, current_date, euclidean_distance, log
 import src.utilities.config as config
-from src.drawing import pp_draw
 
 import numpy as np
 import time
 
+PATH_CHUNK_STEPS = 1024   # steps of the path of the drones given at once to the environment, in the sparse runs
+
 
 class Simulator:
 
-    def __init__(self,
-                 sim_seed=config.SIM_SEED,
-                 ts_duration_sec=config.SIM_TS_DURATION,
-                 sim_duration_ts=config.SIM_DURATION,
-                 n_drones=config.N_DRONES,
-                 env_width_meters=config.ENV_WIDTH,
-                 env_height_meters=config.ENV_HEIGHT,
-                 drone_speed=config.DRONE_SPEED,
-                 drone_max_battery=config.DRONE_MAX_ENERGY,
-                 drone_max_buffer=config.DRONE_MAX_BUFFER_SIZE,
-                 drone_com_range_meters=config.DRONE_COM_RANGE,
-                 drone_sen_range_meters=config.DRONE_SENSING_RANGE,
-                 drone_radar_range_meters=config.DRONE_RADAR_RADIUS,
-                 drone_coo=config.INITIAL_DRONE_COORDS,
-                 bs_com_range_meters=config.BASE_STATION_COM_RANGE,
-                 bs_coords=config.BASE_STATION_COORDS,
-                 n_obstacles=config.N_OBSTACLES,
-                 n_grid_cells=config.N_GRID_CELLS,
-                 target_coods=config.TARGETS_COORDS
-                 ):
+    def __init__(self, sim_config: config.SimulationConfig = None, **parameters):
+        """ The parameters of the simulation are those of sim_config, by default the constants in
+        src.utilities.config, changed by the given keyword parameters, e.g. Simulator(n_drones=5, sim_seed=1). """
+
+        self.config = (config.SimulationConfig() if sim_config is None else sim_config).replace(**parameters)
+        cfg = self.config
 
         self.cur_step = 0
-        self.sim_seed = sim_seed
-        self.ts_duration_sec = ts_duration_sec
-        self.sim_duration_ts = sim_duration_ts
-        self.env_width_meters, self.env_height_meters = env_width_meters, env_height_meters
-        self.n_drones = n_drones
-        self.n_obstacles = n_obstacles
-        self.grid_cell_size = 0 if n_grid_cells <= 0 else int(self.env_width_meters / n_grid_cells)
+        self.sim_seed = cfg.sim_seed
+        self.ts_duration_sec = cfg.ts_duration_sec
+        self.sim_duration_ts = cfg.sim_duration_ts
+        self.env_width_meters, self.env_height_meters = cfg.env_width_meters, cfg.env_height_meters
+        self.n_drones = cfg.n_drones
+        self.n_obstacles = cfg.n_obstacles
+        self.obstacles_cell_size = cfg.obstacles_cell_size
+        self.grid_cell_size = 0 if cfg.n_grid_cells <= 0 else int(self.env_width_meters / cfg.n_grid_cells)
 
         # if this coo is not none, then the drones are self driven
-        self.drone_coo = drone_coo
+        self.drone_coo = cfg.drone_coo
         self.selected_drone = None
 
-        self.drone_speed_meters_sec = drone_speed
-        self.drone_max_battery = drone_max_battery
-        self.drone_max_buffer = drone_max_buffer
-        self.drone_com_range_meters = drone_com_range_meters
-        self.drone_sen_range_meters = drone_sen_range_meters
-        self.drone_radar_range_meters = drone_radar_range_meters
-        self.bs_com_range_meters = bs_com_range_meters
-        self.bs_coords = bs_coords
-        self.target_coods = target_coods
+        self.drone_speed_meters_sec = cfg.drone_speed
+        self.drone_max_battery = cfg.drone_max_battery
+        self.drone_max_buffer = cfg.drone_max_buffer
+        self.drone_com_range_meters = cfg.drone_com_range_meters
+        self.drone_sen_range_meters = cfg.drone_sen_range_meters
+        self.drone_radar_range_meters = cfg.drone_radar_range_meters
+        self.bs_com_range_meters = cfg.bs_com_range_meters
+        self.bs_coords = cfg.bs_coords
+        self.target_coods = cfg.target_coods
+        self.swarm_engine = cfg.swarm_engine
+        self.fast_forward = cfg.fast_forward
+        self.tours_timeline = cfg.tours_timeline
+        self.swarm = None
+        self.scheduler = None
+        self.live_publisher = None
+        self.recorder = None
 
         # create the world entites
         self.__set_randomness()
         self.__create_world_entities()
         self.__setup_plotting()
+        self.__setup_live_view()
+        self.__setup_recording()
 
     def simulation_duration_sec(self):
         return self.sim_duration_ts * self.ts_duration_sec
@@ -71,33 +71,45 @@ class Simulator:
     def is_free_movement(self):
         return self.drone_coo is not None
 
+    def is_tours_timeline(self):
+        """ Drones following their tours look their positions up in the compiled timeline. """
+        return self.tours_timeline and not self.is_free_movement()
+
+    def is_fast_forward(self):
+        """ Event-driven scheduling applies only to drones following their tours step by step. """
+        return self.fast_forward and not self.is_free_movement() and not self.is_tours_timeline()
+
+    def is_random_access(self):
+        """ Without obstacles the timeline gives the state of the drones at any step, with no need to step. """
+        return self.is_tours_timeline() and len(self.environment.obstacles) == 0
+
     def detect_key_pressed(self, key_pressed):
         """ Moves the drones freely. """
 
         if key_pressed in ['a', 'A']:  # decrease angle
-            self.selected_drone.angle -= config.DRONE_ANGLE_INCREMENT
+            self.selected_drone.angle -= self.config.drone_angle_increment
             self.selected_drone.angle = self.selected_drone.angle % 360
 
         elif key_pressed in ['d', 'D']:  # increase angle
-            self.selected_drone.angle += config.DRONE_ANGLE_INCREMENT
+            self.selected_drone.angle += self.config.drone_angle_increment
             self.selected_drone.angle = self.selected_drone.angle % 360
 
         elif key_pressed in ['w', 'W']:  # increase speed
-            self.selected_drone.speed += config.DRONE_SPEED_INCREMENT
+            self.selected_drone.speed += self.config.drone_speed_increment
 
         elif key_pressed in ['s', 'S']:  # decrease speed
-            self.selected_drone.speed -= config.DRONE_SPEED_INCREMENT
+            self.selected_drone.speed -= self.config.drone_speed_increment
 
     def detect_drone_click(self, position):
         """ Handles drones selection in the simulation. """
-        click_coords_to_map = (self.environment.width/config.DRAW_SIZE*position[0], self.environment.height/config.DRAW_SIZE*(config.DRAW_SIZE-position[1]))
+        click_coords_to_map = (self.environment.width/self.config.draw_size*position[0], self.environment.height/self.config.draw_size*(self.config.draw_size-position[1]))
         entities_distance = [euclidean_distance(drone.coords, click_coords_to_map) for drone in self.environment.drones]
         clicked_drone = self.environment.drones[np.argmin(entities_distance)] # potentially clicked drone
 
         TOLERATED_CLICK_DISTANCE = 40
 
         closest_drone_coords = clicked_drone.coords
-        dron_coords_to_screen = (closest_drone_coords[0]*config.DRAW_SIZE/self.environment.width, config.DRAW_SIZE - (closest_drone_coords[1]*config.DRAW_SIZE/self.environment.width))
+        dron_coords_to_screen = (closest_drone_coords[0]*self.config.draw_size/self.environment.width, self.config.draw_size - (closest_drone_coords[1]*self.config.draw_size/self.environment.width))
 
         if euclidean_distance(dron_coords_to_screen, position) < TOLERATED_CLICK_DISTANCE:
             # DRONE WAS CLICKED HANDLE NOW
@@ -108,9 +120,23 @@ class Simulator:
         self.selected_drone = clicked_drone
 
     def __setup_plotting(self):
-        if config.PLOT_SIM or config.SAVE_PLOT:
+        if self.config.is_plotting():
+            from src.drawing import pp_draw  # the drawing stack is loaded only when a renderer is requested
             self.draw_manager = pp_draw.PathPlanningDrawer(self.environment, self, borders=True)
 
+    def __setup_live_view(self):
+        if self.config.live_view:
+            from src.simulation.live_view import LivePublisher
+            self.live_publisher = LivePublisher(self)
+            log("Live view: python -m src.simulation.live_view {}".format(self.live_publisher.name))
+
+    def __setup_recording(self):
+        if self.config.trajectory_dir is not None:
+            from src.utilities.trajectory import TrajectoryRecorder, trace_directory
+            self.recorder = TrajectoryRecorder(self, trace_directory(self.config.trajectory_dir, self.simulation_name()),
+                                               self.config.trajectory_decimation, self.config.trajectory_float32, self.config.trajectory_chunk)
+            log("Recording the trajectories in {}".format(self.recorder.directory))
+
     def __set_randomness(self):
         """ Set the random generators. """
         self.rnd_env = np.random.RandomState(self.sim_seed)
@@ -120,7 +146,7 @@ class Simulator:
         """ Creates the world entities. """
 
         if self.drone_coo is None:
-            self.path_manager = PathManager(config.FIXED_TOURS_DIR + "RANDOM_missions", self.sim_seed)
+            self.path_manager = PathManager(self.config.fixed_tours_dir + "RANDOM_missions", self.sim_seed, self.config.handcrafted_path)
 
         self.environment = Environment(self.env_width_meters, self.env_height_meters, self)
 
@@ -147,17 +173,28 @@ class Simulator:
         self.environment.add_base_station(base_stations)
         self.environment.add_drones(drones)
 
+        self.event_generator = EventGenerator(self) if self.config.events_process is not None else None
+
+        if self.swarm_engine or self.is_fast_forward() or self.is_tours_timeline():
+            timeline = None
+            if self.is_tours_timeline():
+                timeline = ToursTimeline([drone.path for drone in drones], [drone.speed for drone in drones], self.ts_duration_sec)
+            self.swarm = SwarmKinematics(drones, self, timeline)
+
+    def draw(self, cur_step):
+        """ Draws the current state of the simulation. """
+        self.__plot(cur_step)
+
     def __plot(self, cur_step):
         """ Plot the simulation """
 
-        if cur_step % config.SKIP_SIM_STEP != 0:
+        if cur_step % self.config.skip_sim_step != 0:
             return
 
-        if config.WAIT_SIM_STEP > 0:
-            time.sleep(config.WAIT_SIM_STEP)
+        if self.config.wait_sim_step > 0:
+            time.sleep(self.config.wait_sim_step)
 
-        self.draw_manager.grid_plot()
-        self.draw_manager.borders_plot()
+        self.draw_manager.draw_static_layer(self.target_coods)
 
         for drone in self.environment.drones:
             self.draw_manager.draw_drone(drone, cur_step)
@@ -169,25 +206,113 @@ class Simulator:
             self.draw_manager.draw_event(event)
 
         self.draw_manager.draw_simulation_info(cur_step=cur_step, max_steps=self.sim_duration_ts)
-        self.draw_manager.draw_obstacles()
-        self.draw_manager.draw_target(self.target_coods)
-        self.draw_manager.update(save=config.SAVE_PLOT, filename=self.simulation_name() + str(cur_step) + ".png")
+        self.draw_manager.export(cur_step)
+        self.draw_manager.update(save=self.config.save_plot, show=self.config.plot_sim, filename=self.simulation_name() + str(cur_step) + ".png")
 
     def run(self):
         """ The method starts the simulation. """
 
+        if self.is_fast_forward() or self.is_random_access():
+            self.__run_sparse()
+            return
+
         for cur_step in range(self.sim_duration_ts):
             self.cur_step = cur_step
 
-            for drone in self.environment.drones:
-                self.environment.detect_collision(drone)
-                drone.move()
+            self.environment.detect_collisions()
+            if self.swarm is not None:
+                self.swarm.move()
+            else:
+                for drone in self.environment.drones:
+                    drone.move()
+            self.environment.detect_visits()
+            self.environment.update_coverage()
+
+            if self.config.neighbors_discovery:
+                self.environment.update_neighbors()
 
-            if config.SAVE_PLOT or config.PLOT_SIM:
+            if self.event_generator is not None:
+                self.event_generator.handle_events_generation(cur_step, self.environment.drones)
+
+            if self.config.is_plotting():
+                self.__plot(cur_step)
+
+            if self.live_publisher is not None and cur_step % self.config.skip_sim_step == 0:
+                self.live_publisher.publish()
+
+            if self.recorder is not None:
+                self.recorder.record(cur_step)
+
+    def __run_sparse(self):
+        """ Jumps the clock to the plotted steps, to the steps with events and to the last one, the state of the drones
+        is computed only there: by the event-driven scheduler, or looked up in the tours timeline. """
+        tracks_travel = self.environment.tracks_travel()
+        if self.is_fast_forward():
+            self.scheduler = FastForwardScheduler(self, track_path=tracks_travel)
+            advance_to, path = self.scheduler.advance_to, self.scheduler.path
+        else:
+            advance_to, path = self.swarm.seek, self.swarm.path
+
+        plotting = self.config.is_plotting()
+        last_step = self.sim_duration_ts - 1
+        cur_step, travelled_step = 0, -1
+        while True:
+            self.cur_step = cur_step
+            advance_to(cur_step)
+            if tracks_travel:
+                self.__travel(path, travelled_step + 1, cur_step)
+                travelled_step = cur_step
+            if self.config.neighbors_discovery:
+                self.environment.update_neighbors()
+            if self.event_generator is not None:
+                self.event_generator.handle_events_generation(cur_step, self.environment.drones)
+            if plotting:
                 self.__plot(cur_step)
+            if self.live_publisher is not None:
+                self.live_publisher.publish()
+            if self.recorder is not None:
+                self.recorder.record(cur_step)
+
+            if cur_step >= last_step:
+                break
+
+            next_steps = [last_step]
+            if plotting or self.live_publisher is not None:
+                next_steps.append((cur_step // self.config.skip_sim_step + 1) * self.config.skip_sim_step)
+            if self.event_generator is not None and self.event_generator.next_event_step() is not None:
+                next_steps.append(self.event_generator.next_event_step())
+            if self.recorder is not None:
+                next_steps.append(self.recorder.next_step(cur_step))
+            cur_step = min(next_steps)
+
+    def __travel(self, path, first_step, last_step):
+        """ Gives the environment the path of the drones from first_step to last_step, a chunk of steps at a time. """
+        for chunk_step in range(first_step, last_step + 1, PATH_CHUNK_STEPS):
+            starts, ends = path(chunk_step, min(chunk_step + PATH_CHUNK_STEPS - 1, last_step))
+            self.environment.travel(starts, ends, chunk_step)
+
+    def metrics(self):
+        """ Returns the metrics of the simulation as a dictionary. """
+        metrics = {"n_collisions": self.environment.n_collisions}
+        coverage = self.environment.coverage
+        if coverage is not None and coverage.n_updates > 0:
+            metrics["covered_fraction"] = float(coverage.covered_fraction())
+            metrics["cell_idleness_sec"] = float(coverage.average_idleness()) * self.ts_duration_sec
+        if self.environment.n_topology_updates > 0:
+            metrics["bs_connectivity"] = self.environment.bs_connectivity_sum / self.environment.n_topology_updates
+            metrics["n_components"] = self.environment.n_components_sum / self.environment.n_topology_updates
+        return metrics
 
     def print_metrics(self):
-        pass
+        for metric, value in self.metrics().items():
+            log("{}: {}".format(metric, value))
 
     def close(self):
-        pass
+        if self.config.is_plotting():
+            self.draw_manager.close()
+        if self.live_publisher is not None:
+            self.live_publisher.close()
+            self.live_publisher = None
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
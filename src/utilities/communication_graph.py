@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def _union(labels, i, j):
+    """ Merges in place the components of the endpoints of the links (i[k], j[k]). labels is a fully compressed
+    union-find: every device points to the smallest device of its component. """
+    while True:
+        if np.array_equal(labels[i], labels[j]):
+            return
+        low = np.minimum(labels[i], labels[j])
+        # hook the roots to the smallest one, then compress the paths
+        np.minimum.at(labels, labels[i], low)
+        np.minimum.at(labels, labels[j], low)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels[:] = jumped
+
+
+class CommunicationGraph:
+    """ The communication topology of the drones and base stations, as the links given at every step by the
+    neighbors grid. Only the links that changed since the previous step are processed: new links merge
+    components in the union-find, lost links (that may split a component) rebuild it from the current links.
+    After every update, whether a device reaches a base station, directly or through other drones, is a lookup. """
+
+    def __init__(self, n_devices, base_stations):
+        self.n_devices = n_devices
+        self.base_stations = np.asarray(base_stations, dtype=int)   # indices of the base stations among the devices
+
+        self.links = np.zeros(0, dtype=np.int64)     # sorted keys i * n_devices + j of the links i < j
+        self.labels = np.arange(n_devices)           # smallest device of the component of every device
+        self.bs_connected = np.zeros(n_devices, dtype=bool)   # whether every device reaches a base station
+        self.n_components = n_devices
+        self.__update_components()
+
+        self.n_rebuilds = 0
+
+    def update(self, pairs):
+        """ Sets the links to the (n_pairs, 2) array of the devices in range (i, j), i < j. """
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        links = np.unique(pairs[:, 0] * self.n_devices + pairs[:, 1])
+
+        lost = np.setdiff1d(self.links, links, assume_unique=True)
+        new = np.setdiff1d(links, self.links, assume_unique=True)
+        self.links = links
+        if len(lost) == 0 and len(new) == 0:
+            return
+
+        if len(lost) > 0:
+            self.n_rebuilds += 1
+            self.labels = np.arange(self.n_devices)
+            new = links
+
+        _union(self.labels, new // self.n_devices, new % self.n_devices)
+        self.__update_components()
+
+    def __update_components(self):
+        self.bs_connected = np.isin(self.labels, self.labels[self.base_stations])
+        self.n_components = int(np.count_nonzero(self.labels == np.arange(self.n_devices)))
+
+    def is_connected_to_bs(self, i):
+        """ Whether device i reaches a base station, directly or through other devices. """
+        return self.bs_connected[i]
+
+    def component(self, i):
+        """ Returns the indices of the devices in the same component of device i. """
+        return np.flatnonzero(self.labels == self.labels[i])
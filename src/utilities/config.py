@@ -1,4 +1,5 @@
 
+from dataclasses import dataclass, field, replace
 from enum import Enum
 import numpy as np
 
@@ -19,6 +20,7 @@ ENV_HEIGHT = 1500     # float: meters, height of environment
 
 N_DRONES = 2          # int: number of drones.
 N_OBSTACLES = 10      # number of random obstacles in the map
+OBSTACLES_CELL_SIZE = 150   # float: meters, cell size of the obstacles spatial index (0 scans all the obstacles)
 N_GRID_CELLS = 3      # number of cells in the grid
 
 # IMPORTANT: coordinates of the drones at the beginning, it can be NONE in that case drone will follow
@@ -31,7 +33,7 @@ DRONE_SPEED_INCREMENT = 5     # increment at every key stroke
 DRONE_ANGLE_INCREMENT = 45    # increment at every key stroke
 DRONE_COM_RANGE = 100         # float: meters, communication range of the drones.
 DRONE_SENSING_RANGE = 0       # float: meters, the sensing range of the drones.
-DRONE_MAX_BUFFER_SIZE = 0     # int: max number of packets in the buffer of a drone.
+DRONE_MAX_BUFFER_SIZE = 0     # int: max number of packets in the buffer of a drone (0 for no limit).
 DRONE_MAX_ENERGY = 100        # int: max energy of a drone.
 DRONE_RADAR_RADIUS = 60       # meters
 
@@ -46,13 +48,134 @@ PLOT_TRAJECTORY_NEXT_TARGET = True
 
 FIXED_TOURS_DIR = "data/tours/"        # str: the path to the drones tours
 HANDCRAFTED_PATH = False
+SWARM_ENGINE = False       # bool: move all the drones with one batched update per step (faster with many drones)
+FAST_FORWARD = False       # bool: with tours, step each drone only at its waypoints and near obstacles (event-driven, not bit-exact)
+TOURS_TIMELINE = False     # bool: with tours, drones fly exactly through the waypoints, looked up in a compiled timeline
+NEIGHBORS_DISCOVERY = False   # bool: find at every step the drones and base stations within communication range
 
 PLOT_SIM = True       # bool: whether to plot or not the simulation (set to false for faster experiments)
 WAIT_SIM_STEP = 0     # float >= 0: seconds, pauses the rendering for x seconds
 SKIP_SIM_STEP = 5     # int > 0 : steps, plot the simulation every x steps
 DRAW_SIZE = 700       # int: size of the drawing window
 
+LIVE_VIEW = False     # bool: publish the state every SKIP_SIM_STEP steps for a viewer process (src.simulation.live_view)
+
+HEADLESS_IMPORT_BUDGET_SEC = 0.5   # float: seconds, max time to import the simulator when nothing is plotted
+
 SAVE_PLOT = False              # bool: whether to save the plots of the simulation or not
 SAVE_PLOT_DIR = "data/plots/"  # string: where to save plots
+SAVE_PLOT_WORKERS = 2          # int: threads saving the plots in background
+SAVE_PLOT_QUEUE = 32           # int: plots waiting to be saved, when full the simulation waits
+SAVE_PLOT_DROP = False         # bool: drop the plots when the queue is full instead of waiting
+
+VIDEO_EXPORT = None   # str: file where to stream the plots, a video (e.g. .mp4, needs ffmpeg) or a .npz archive
+VIDEO_FPS = 30        # int: frames per second of the exported video
+
+TRAJECTORY_DIR = None        # str: where to record the state of the drones (src.utilities.trajectory), None to not record
+TRAJECTORY_DECIMATION = 1    # int > 0: steps, record the state every x steps
+TRAJECTORY_FLOAT32 = True    # bool: record positions, headings and speeds in float32, float64 otherwise
+TRAJECTORY_CHUNK = 4096      # int: records per file of the trace
+
+EXPERIMENTS_DIR = "data/experiments/"   # string: where to save the results of the experimental campaigns
+CAMPAIGN_PROCESSES = None               # int: processes running a campaign, None uses all the cores
+
+EVENTS_PROCESS = None               # str: arrival of the events, "periodic", "poisson", "per_drone" or None for no events
+EVENT_GENERATION_DELAY = 100        # int: steps, (mean) time between two events
+DRONES_EVENTS_RATES = None          # list: events per step of every drone for "per_drone", None splits 1 / delay evenly
+EVENTS_RETENTION = 10000            # int: expired events kept in memory, the older are spilled to disk (None keeps all)
+EVENTS_SPILL_DIR = "data/events/"   # string: where to spill the expired events
 
 TARGETS_COORDS = [(750, 750)]
+TARGETS_VISIT_RADIUS = 10   # float: meters, a target is visited by the drones passing closer than this
+
+
+# ------------------------------- CONFIGURATION OBJECT ------------------------------- #
+
+def _current(constant):
+    """ Default of a SimulationConfig field: the value of the constant above when the object is created. """
+    return field(default_factory=lambda: _freeze(globals()[constant]))
+
+
+def _freeze(value):
+    """ Lists become tuples, so that the configuration is hashable. """
+    return tuple(_freeze(v) for v in value) if isinstance(value, (list, tuple)) else value
+
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    """ Immutable and hashable parameters of one simulation. Each simulator carries its own, passed explicitly to
+    it and read by its entities through simulator.config, so that many simulators can run in the same process.
+    The fields not given take the value of the constants in this module when the object is created, e.g.
+    SimulationConfig(n_drones=10) or config.replace(sim_seed=1). """
+
+    sim_seed: int = _current("SIM_SEED")
+    ts_duration_sec: float = _current("SIM_TS_DURATION")
+    sim_duration_ts: int = _current("SIM_DURATION")
+    env_width_meters: float = _current("ENV_WIDTH")
+    env_height_meters: float = _current("ENV_HEIGHT")
+
+    n_drones: int = _current("N_DRONES")
+    n_obstacles: int = _current("N_OBSTACLES")
+    obstacles_cell_size: float = _current("OBSTACLES_CELL_SIZE")
+    n_grid_cells: int = _current("N_GRID_CELLS")
+
+    drone_coo: tuple = _current("INITIAL_DRONE_COORDS")
+    drone_speed: float = _current("DRONE_SPEED")
+    drone_speed_increment: float = _current("DRONE_SPEED_INCREMENT")
+    drone_angle_increment: float = _current("DRONE_ANGLE_INCREMENT")
+    drone_com_range_meters: float = _current("DRONE_COM_RANGE")
+    drone_sen_range_meters: float = _current("DRONE_SENSING_RANGE")
+    drone_max_buffer: int = _current("DRONE_MAX_BUFFER_SIZE")
+    drone_max_battery: int = _current("DRONE_MAX_ENERGY")
+    drone_radar_range_meters: float = _current("DRONE_RADAR_RADIUS")
+
+    bs_coords: tuple = _current("BASE_STATION_COORDS")
+    bs_com_range_meters: float = _current("BASE_STATION_COM_RANGE")
+    target_coods: tuple = _current("TARGETS_COORDS")
+    targets_visit_radius: float = _current("TARGETS_VISIT_RADIUS")
+    events_process: str = _current("EVENTS_PROCESS")
+    event_generation_delay: int = _current("EVENT_GENERATION_DELAY")
+    drones_events_rates: tuple = _current("DRONES_EVENTS_RATES")
+    events_retention: int = _current("EVENTS_RETENTION")
+    events_spill_dir: str = _current("EVENTS_SPILL_DIR")
+
+    fixed_tours_dir: str = _current("FIXED_TOURS_DIR")
+    handcrafted_path: bool = _current("HANDCRAFTED_PATH")
+    swarm_engine: bool = _current("SWARM_ENGINE")
+    fast_forward: bool = _current("FAST_FORWARD")
+    tours_timeline: bool = _current("TOURS_TIMELINE")
+    neighbors_discovery: bool = _current("NEIGHBORS_DISCOVERY")
+
+    plot_sim: bool = _current("PLOT_SIM")
+    wait_sim_step: float = _current("WAIT_SIM_STEP")
+    skip_sim_step: int = _current("SKIP_SIM_STEP")
+    draw_size: int = _current("DRAW_SIZE")
+    live_view: bool = _current("LIVE_VIEW")
+    plot_trajectory_next_target: bool = _current("PLOT_TRAJECTORY_NEXT_TARGET")
+    save_plot: bool = _current("SAVE_PLOT")
+    save_plot_dir: str = _current("SAVE_PLOT_DIR")
+    save_plot_workers: int = _current("SAVE_PLOT_WORKERS")
+    save_plot_queue: int = _current("SAVE_PLOT_QUEUE")
+    save_plot_drop: bool = _current("SAVE_PLOT_DROP")
+    video_export: str = _current("VIDEO_EXPORT")
+    video_fps: int = _current("VIDEO_FPS")
+    trajectory_dir: str = _current("TRAJECTORY_DIR")
+    trajectory_decimation: int = _current("TRAJECTORY_DECIMATION")
+    trajectory_float32: bool = _current("TRAJECTORY_FLOAT32")
+    trajectory_chunk: int = _current("TRAJECTORY_CHUNK")
+
+    def __post_init__(self):
+        for name in self.__dataclass_fields__:
+            object.__setattr__(self, name, _freeze(getattr(self, name)))
+
+    def replace(self, **changes):
+        """ Returns a copy of this configuration with the given fields changed. """
+        return replace(self, **changes)
+
+    def headless(self):
+        """ Returns a copy of this configuration that writes nothing: no window, plots, live view, video or trace. """
+        return self.replace(plot_sim=False, save_plot=False, live_view=False, video_export=None, trajectory_dir=None)
+
+    def is_plotting(self):
+        """ Whether frames are drawn, in a window if plot_sim, otherwise off-screen to be saved or exported. """
+        return self.plot_sim or self.save_plot or self.video_export is not None
@@ -0,0 +1,94 @@
+from src.utilities.utilities import TraversedCells
+
+import numpy as np
+
+
+class CoverageMap:
+    """ Coverage of the grid cells by the drones, updated at every step with the cells they traversed. For every cell
+    it keeps the number of visits (entrances of a drone), the step of the last visit and the idleness accumulated
+    until then, so that an update only touches the traversed cells and the statistics are available at any step.
+    The idleness of a cell is the number of steps since its last visit (since the start if never visited). """
+
+    def __init__(self, size_cell, width_area, height_area):
+        self.size_cell, self.width_area = size_cell, width_area
+        self.n_cells_x = TraversedCells.n_cells_x(size_cell, width_area)
+        self.n_cells_y = TraversedCells.n_cells_x(size_cell, height_area)
+        n_cells = self.n_cells_x * self.n_cells_y
+
+        self.visits = np.zeros(n_cells, dtype=int)
+        self.last_visit = np.zeros(n_cells, dtype=int)
+        self.closed_idleness = np.zeros(n_cells, dtype=float)   # idleness summed over the steps up to the last visit
+        self.cur_step = 0
+        self.n_updates = 0
+
+    def __inside(self, coords):
+        """ The positions on the far borders of the area are moved in its last cells. """
+        far_borders = np.nextafter(np.array([self.n_cells_x, self.n_cells_y]) * self.size_cell, 0)
+        return np.clip(np.asarray(coords, dtype=float).reshape(-1, 2), 0, far_borders)
+
+    def __cell_number(self, cells):
+        return cells[:, 0] + self.n_cells_x * cells[:, 1]
+
+    def update(self, starts, ends, cur_step):
+        """ The drones travelled from starts to ends (n, 2) in cur_step, the cells they entered are visited. """
+        self.update_path(np.asarray(starts, dtype=float).reshape(1, -1, 2), np.asarray(ends, dtype=float).reshape(1, -1, 2), cur_step)
+
+    def update_path(self, starts, ends, first_step):
+        """ The drones travelled from starts[k] to ends[k] (steps, n, 2) in step first_step + k, for every k: the same
+        as an update per step, in one batched pass. """
+        n_steps, n_drones = starts.shape[:2]
+        steps = np.repeat(first_step + np.arange(n_steps), n_drones)
+        starts, ends = self.__inside(starts), self.__inside(ends)
+        _, start_xy = TraversedCells.coords_to_cells(self.size_cell, self.width_area, starts)
+        _, end_xy = TraversedCells.coords_to_cells(self.size_cell, self.width_area, ends)
+        start_cells, end_cells = self.__cell_number(start_xy), self.__cell_number(end_xy)
+
+        moved = start_cells != end_cells
+        entered, entered_steps = [end_cells[moved]], [steps[moved]]
+        if self.n_updates == 0:
+            entered.append(start_cells[:n_drones])
+            entered_steps.append(steps[:n_drones])
+        for i in np.flatnonzero(np.abs(end_xy - start_xy).sum(axis=1) > 1):
+            # the cells crossed on the way, only drones moving past the adjacent cells need the traversal
+            cells = np.array(TraversedCells.cells_in_travel(self.size_cell, self.width_area, starts[i], ends[i])[1:-1], dtype=int).reshape(-1, 2)
+            entered.append(self.__cell_number(cells))
+            entered_steps.append(np.full(len(cells), steps[i]))
+        entered, entered_steps = np.concatenate(entered), np.concatenate(entered_steps)
+        np.add.at(self.visits, entered, 1)
+
+        # the steps at which each cell was touched, in order, every one closes the idleness since the previous one
+        touched = np.unique(np.concatenate([entered, start_cells, end_cells]) * n_steps
+                            + np.concatenate([entered_steps, steps, steps]) - first_step)
+        cells, touch_steps = touched // n_steps, touched % n_steps + first_step
+        first_touch = np.r_[True, cells[1:] != cells[:-1]]
+        gap = touch_steps - np.where(first_touch, self.last_visit[cells], np.r_[0, touch_steps[:-1]])
+        np.add.at(self.closed_idleness, cells, (gap - 1) * gap / 2)   # idleness 1, ..., gap - 1 before the visit
+        last_touch = np.r_[cells[1:] != cells[:-1], True]
+        self.last_visit[cells[last_touch]] = touch_steps[last_touch]
+        self.cur_step = first_step + n_steps - 1
+        self.n_updates += n_steps
+
+    def idleness(self, cur_step=None):
+        """ The idleness of every cell at cur_step, by default the last update. """
+        cur_step = self.cur_step if cur_step is None else cur_step
+        return cur_step - self.last_visit
+
+    def cumulative_idleness(self, cur_step=None):
+        """ The idleness of every cell summed over all the steps until cur_step, by default the last update. """
+        gap = self.idleness(cur_step)
+        return self.closed_idleness + gap * (gap + 1) / 2
+
+    def covered_fraction(self):
+        """ The fraction of cells visited at least once. """
+        return np.count_nonzero(self.visits) / len(self.visits)
+
+    def mean_idleness(self, cur_step=None):
+        return np.mean(self.idleness(cur_step))
+
+    def max_idleness(self, cur_step=None):
+        return np.max(self.idleness(cur_step))
+
+    def average_idleness(self, cur_step=None):
+        """ The idleness of the cells averaged over the cells and the steps until cur_step, by default the last update. """
+        cur_step = self.cur_step if cur_step is None else cur_step
+        return np.mean(self.cumulative_idleness(cur_step)) / (cur_step + 1)
@@ -0,0 +1,91 @@
+from src.utilities.utilities import make_path
+
+from collections import deque
+import heapq
+import itertools
+
+
+class EventStore:
+    """ The events of the environment, ordered by expiry. An event is any object with an expiry_step and an
+    is_expired(ts) method, true from expiry_step on. The clock only moves forward: advance(ts) moves the events
+    expired at ts out of the valid ones, looking only at those. Events generated with non decreasing expiry, as with
+    a fixed time to live, are queued in O(1), the others go in a heap.
+
+    Only the last `retention` expired events stay in memory (None keeps them all), the older are appended in
+    batches to spill_file and can be read back with spilled_events. """
+
+    def __init__(self, retention=None, spill_file=None):
+        self.retention = retention
+        self.spill_file = spill_file
+        self.n_spilled = 0
+
+        self.valid = dict()         # insertion order -> event, not expired yet
+        self.expired = deque()      # the last expired events, the first to expire first
+        self.__in_order = deque()   # (expiry step, insertion order, event) in order of expiry
+        self.__out_of_order = []    # heap of (expiry step, insertion order, event)
+        self.__order = itertools.count()
+        self.cur_ts = None
+
+    def __len__(self):
+        """ The events in memory. """
+        return len(self.valid) + len(self.expired)
+
+    def append(self, event):
+        entry = (event.expiry_step, next(self.__order), event)
+        if not self.__in_order or self.__in_order[-1][0] <= entry[0]:
+            self.__in_order.append(entry)
+        else:
+            heapq.heappush(self.__out_of_order, entry)
+        self.valid[entry[1]] = event
+
+    def advance(self, ts):
+        """ Moves the clock to step ts, the events expired by then leave the valid ones. """
+        if self.cur_ts is not None and ts <= self.cur_ts:
+            return
+        self.cur_ts = ts
+
+        while True:
+            if self.__in_order and self.__in_order[0][2].is_expired(ts) \
+                    and (not self.__out_of_order or self.__in_order[0] <= self.__out_of_order[0]):
+                _, order, event = self.__in_order.popleft()
+            elif self.__out_of_order and self.__out_of_order[0][2].is_expired(ts):
+                _, order, event = heapq.heappop(self.__out_of_order)
+            else:
+                break
+            del self.valid[order]
+            self.expired.append(event)
+
+        if self.retention is not None and len(self.expired) >= 2 * self.retention + 1:
+            self.__spill(len(self.expired) - self.retention)
+
+    def valid_events(self, ts):
+        """ A view of the events not expired at step ts, in order of creation. """
+        self.advance(ts)
+        return self.valid.values()
+
+    def expired_events(self, ts):
+        """ The expired events at step ts still in memory, the first to expire first. """
+        self.advance(ts)
+        return self.expired
+
+    def __spill(self, n_events):
+        """ Appends the n_events oldest expired events to the spill file, or forgets them if there is none. """
+        batch = [self.expired.popleft() for _ in range(n_events)]
+        if self.spill_file is not None:
+            import pickle
+            make_path(self.spill_file)
+            with open(self.spill_file, "ab") as out:
+                pickle.dump(batch, out)
+        self.n_spilled += n_events
+
+    def spilled_events(self):
+        """ Iterates over the events spilled to disk, the first to expire first. """
+        if self.spill_file is None or self.n_spilled == 0:
+            return
+        import pickle
+        with open(self.spill_file, "rb") as in_file:
+            while True:
+                try:
+                    yield from pickle.load(in_file)
+                except EOFError:
+                    return
@@ -0,0 +1,63 @@
+import heapq
+import itertools
+
+
+class PacketBuffer:
+    """ Buffer of the packets carried by a device. A packet is any object with an identifier, an expiry_step and an
+    is_expired(ts) method, true from expiry_step on. The packets are indexed by identifier, for membership and
+    removal in O(1), and by expiry in a heap, so that dropping the expired ones costs O(log n) each. Removed packets
+    stay in the heap until they get to its top, or until they are the majority of it. """
+
+    def __init__(self, max_size=0):
+        self.max_size = max_size    # max number of packets, 0 for no limit
+        self.packets = dict()       # identifier -> packet
+        self.expiries = []          # heap of (expiry step, insertion order, packet)
+        self.__order = itertools.count()
+
+    def __len__(self):
+        return len(self.packets)
+
+    def __contains__(self, packet):
+        return packet.identifier in self.packets
+
+    def __iter__(self):
+        return iter(list(self.packets.values()))
+
+    def is_full(self):
+        return 0 < self.max_size <= len(self.packets)
+
+    def add(self, packet):
+        """ Adds the packet if it is new and there is room for it, returns whether it was added. """
+        if packet in self or self.is_full():
+            return False
+        self.packets[packet.identifier] = packet
+        heapq.heappush(self.expiries, (packet.expiry_step, next(self.__order), packet))
+        return True
+
+    def remove(self, packet):
+        """ Removes the packet if it is in the buffer, returns whether it was. """
+        if self.packets.pop(packet.identifier, None) is None:
+            return False
+        if len(self.expiries) > 2 * len(self.packets) + 64:
+            self.__compact()
+        return True
+
+    def drop_expired(self, ts):
+        """ Removes and returns the packets expired at step ts, the first to expire first. """
+        dropped = []
+        while self.expiries:
+            _, _, packet = self.expiries[0]
+            if self.packets.get(packet.identifier) is not packet:   # removed in the meanwhile
+                heapq.heappop(self.expiries)
+            elif packet.is_expired(ts):
+                heapq.heappop(self.expiries)
+                del self.packets[packet.identifier]
+                dropped.append(packet)
+            else:
+                break
+        return dropped
+
+    def __compact(self):
+        """ Rebuilds the heap with the packets still in the buffer. """
+        self.expiries = [entry for entry in self.expiries if self.packets.get(entry[2].identifier) is entry[2]]
+        heapq.heapify(self.expiries)
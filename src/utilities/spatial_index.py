@@ -0,0 +1,144 @@
+from src.utilities.utilities import distance_points_segments
+
+import numpy as np
+
+
+def expand_ranges(starts, lengths):
+    """ Given arrays of range starts and lengths, returns (owner, values): the concatenation of all the ranges
+    [starts[i], starts[i] + lengths[i]) and, for each value, the index i of the range it comes from. """
+    starts, lengths = np.asarray(starts, dtype=int), np.asarray(lengths, dtype=int)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner, starts[owner] + offsets
+
+
+class ObstaclesGrid:
+    """ Static uniform grid over the obstacle segments (x1, y1, x2, y2), built once after the obstacles spawn.
+    Every cell stores the obstacles passing through it in a compressed array (cell_start, cell_obstacles), so that
+    a query only looks at the obstacles of the cells it overlaps and its cost depends on the local obstacle density
+    rather than on the size of the map. """
+
+    def __init__(self, obstacles, cell_size):
+        self.obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 4)
+        self.cell_size = float(cell_size)
+
+        points = self.obstacles.reshape(-1, 2)
+        self.origin = points.min(axis=0) if len(points) > 0 else np.zeros(2)
+        extent = points.max(axis=0) - self.origin if len(points) > 0 else np.zeros(2)
+        self.n_cells = (extent // self.cell_size).astype(int) + 1  # cells along x and y
+
+        self.__rasterize()
+
+    def __rasterize(self):
+        """ Assigns every obstacle to the cells of its bounding box that the segment passes through. """
+        p1, p2 = self.obstacles[:, 0:2], self.obstacles[:, 2:4]
+        low, high = self.__cells_range(np.minimum(p1, p2), np.maximum(p1, p2))
+        spans = high - low + 1
+
+        obstacle, k = expand_ranges(np.zeros(len(spans)), spans[:, 0] * spans[:, 1])
+        cells_xy = low[obstacle] + np.stack([k % spans[obstacle, 0], k // spans[obstacle, 0]], axis=1)
+
+        # a segment crossing a square is closer than half diagonal to its center
+        centers = self.origin + (cells_xy + 0.5) * self.cell_size
+        crossed = distance_points_segments(p1[obstacle], p2[obstacle], centers) <= self.cell_size * (2 ** 0.5) / 2 + 1e-9
+
+        cell_ids = self.__cell_id(cells_xy[crossed])
+        order = np.argsort(cell_ids, kind="stable")
+        self.cell_obstacles = obstacle[crossed][order]
+        self.cell_start = np.concatenate([[0], np.cumsum(np.bincount(cell_ids, minlength=self.n_cells.prod()))])
+
+    def __cells_range(self, low_coords, high_coords):
+        """ Returns the (x, y) indices of the cells containing low_coords and high_coords, clipped to the grid. """
+        low = np.floor((low_coords - self.origin) / self.cell_size).astype(int)
+        high = np.floor((high_coords - self.origin) / self.cell_size).astype(int)
+        return np.maximum(low, 0), np.minimum(high, self.n_cells - 1)
+
+    def __cell_id(self, cells_xy):
+        return cells_xy[:, 0] + cells_xy[:, 1] * self.n_cells[0]
+
+    def candidates(self, points, radius):
+        """ Broad phase: returns the pairs (rows, cols) such that obstacle cols[k] passes through a cell overlapping
+        the square of side 2 * radius[rows[k]] around points[rows[k]]. Every obstacle closer than radius to a point
+        is among its candidates, pairs are unique and sorted by point. """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(self.obstacles) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), len(points))[:, None]
+
+        low, high = self.__cells_range(points - radius, points + radius)
+        spans = np.maximum(high - low + 1, 0)
+
+        point, k = expand_ranges(np.zeros(len(spans)), spans[:, 0] * spans[:, 1])
+        cell_ids = self.__cell_id(low[point] + np.stack([k % spans[point, 0], k // spans[point, 0]], axis=1))
+
+        cell_owner, positions = expand_ranges(self.cell_start[cell_ids], np.diff(self.cell_start)[cell_ids])
+        keys = np.unique(point[cell_owner] * len(self.obstacles) + self.cell_obstacles[positions])
+        return keys // len(self.obstacles), keys % len(self.obstacles)
+
+
+class NeighborsGrid:
+    """ Cell list over a set of devices with a communication range, rebuilt from scratch whenever the devices move.
+    The cell size is the largest range, so the devices in range of a device are in its cell or in the 8 around it,
+    and finding all the pairs in range costs about the number of devices times their local density.
+    Two devices are neighbors if their distance is within the range of at least one of them. """
+
+    def __init__(self, points, ranges):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.ranges = np.broadcast_to(np.asarray(ranges, dtype=float), len(self.points))
+        self.cell_size = max(float(self.ranges.max()), 1e-9) if len(self.points) > 0 else 1.0
+
+        self.__bucket()
+        self.pairs = self.__pairs_in_range()
+        self.__adjacency()
+
+    def __bucket(self):
+        """ Sorts the devices by the cell they are in. """
+        cells_xy = np.floor(self.points / self.cell_size).astype(np.int64)
+        self.origin = cells_xy.min(axis=0) - 1 if len(cells_xy) > 0 else np.zeros(2, dtype=np.int64)
+        self.cells_xy = cells_xy - self.origin
+        self.n_cells_x = int(self.cells_xy[:, 0].max()) + 2 if len(cells_xy) > 0 else 1
+
+        cell_ids = self.__cell_id(self.cells_xy)
+        self.order = np.argsort(cell_ids, kind="stable")
+        self.sorted_cell_ids = cell_ids[self.order]
+
+    def __cell_id(self, cells_xy):
+        return cells_xy[:, 0] + cells_xy[:, 1] * self.n_cells_x
+
+    def __pairs_in_range(self):
+        """ Returns the (n_pairs, 2) array of the neighbor devices (i, j), with i < j, sorted. """
+        if len(self.points) < 2:
+            return np.zeros((0, 2), dtype=int)
+
+        # the 3x3 block of cells around every device
+        moves = np.array([(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)])
+        device = np.repeat(np.arange(len(self.points)), len(moves))
+        cell_ids = self.__cell_id(self.cells_xy[device] + np.tile(moves, (len(self.points), 1)))
+
+        starts = np.searchsorted(self.sorted_cell_ids, cell_ids, side="left")
+        ends = np.searchsorted(self.sorted_cell_ids, cell_ids, side="right")
+        owner, positions = expand_ranges(starts, ends - starts)
+
+        i, j = device[owner], self.order[positions]
+        i, j = i[i < j], j[i < j]
+        distance = np.hypot(*(self.points[i] - self.points[j]).T)
+        linked = distance <= np.maximum(self.ranges[i], self.ranges[j])
+
+        pairs = np.stack([i[linked], j[linked]], axis=1)
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    def __adjacency(self):
+        """ Compressed adjacency lists: the neighbors of device i are adjacent[start[i]:start[i + 1]]. """
+        sources = np.concatenate([self.pairs[:, 0], self.pairs[:, 1]])
+        targets = np.concatenate([self.pairs[:, 1], self.pairs[:, 0]])
+        order = np.lexsort((targets, sources))
+        self.adjacent = targets[order]
+        self.start = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=len(self.points)))])
+
+    def neighbors(self, i):
+        """ Returns the sorted indices of the devices in range of device i. """
+        return self.adjacent[self.start[i]:self.start[i + 1]]
+
+    def degrees(self):
+        """ Returns the number of neighbors of every device. """
+        return np.diff(self.start)
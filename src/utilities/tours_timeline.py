@@ -0,0 +1,55 @@
+import numpy as np
+
+
+class ToursTimeline:
+    """ The cyclic tours of a set of drones, compiled once into cumulative arc-length and arrival-step arrays.
+    A drone leaves the first waypoint at step 0 and flies through all the waypoints at constant speed, going
+    back to the first one after the last (as in Drone.increase_waypoint_counter). The position of a drone after any
+    number of steps is a binary search plus an interpolation, with no need to step through the run. """
+
+    def __init__(self, paths: list, speeds: list, ts_duration_sec: float):
+        n_drones = len(paths)
+        self.tour_lengths = np.array([len(path) for path in paths], dtype=int)
+        distance_travelled = np.asarray(speeds, dtype=float) * ts_duration_sec   # meters per step
+
+        # closed tours of all the drones one after the other, drone i owns points[offsets[i]:offsets[i + 1]]
+        closed_tours = [np.vstack([np.asarray(path, dtype=float).reshape(-1, 2), np.asarray(path[0], dtype=float)]) for path in paths]
+        self.points = np.concatenate(closed_tours) if n_drones > 0 else np.zeros((0, 2))
+        self.offsets = np.concatenate([[0], np.cumsum([len(tour) for tour in closed_tours])]).astype(int)
+
+        self.arc_length = np.zeros(len(self.points))   # meters from the first waypoint, along the tour
+        self.arrival = np.zeros(len(self.points))      # steps from the first waypoint, along the tour
+        for i, tour in enumerate(closed_tours):
+            span = slice(self.offsets[i], self.offsets[i + 1])
+            self.arc_length[span] = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(tour, axis=0).T))])
+            self.arrival[span] = self.arc_length[span] / distance_travelled[i] if distance_travelled[i] > 0 else 0
+
+        self.periods = self.arrival[self.offsets[1:] - 1]   # steps to complete a tour
+
+        # arrivals shifted per drone into a single increasing array, to search all the drones at once
+        self.bases = np.concatenate([[0], np.cumsum(self.periods + 1)[:-1]]) if n_drones > 0 else np.zeros(0)
+        self.keys = self.arrival + np.repeat(self.bases, np.diff(self.offsets))
+
+    def __len__(self):
+        return len(self.tour_lengths)
+
+    def locate(self, elapsed_steps, indices=None):
+        """ Returns, for the drones in indices (all by default) after elapsed_steps from the start of their tour,
+        the coordinates, the index of the waypoint they are heading to and the direction of the leg they fly. """
+        rows = np.arange(len(self)) if indices is None else np.asarray(indices)
+        elapsed_steps = np.broadcast_to(np.asarray(elapsed_steps, dtype=float), rows.shape)
+
+        periods = self.periods[rows]
+        tau = np.where(periods > 0, np.mod(elapsed_steps, np.where(periods > 0, periods, 1)), 0) + self.bases[rows]
+
+        # the leg k -> k + 1 of the closed tour being flown
+        k = np.searchsorted(self.keys, tau, side="right") - 1
+        k = np.clip(k, self.offsets[rows], self.offsets[rows + 1] - 2)
+
+        start, end = self.points[k], self.points[k + 1]
+        leg_steps = self.keys[k + 1] - self.keys[k]
+        fraction = np.clip((tau - self.keys[k]) / np.where(leg_steps > 0, leg_steps, 1), 0, 1)
+
+        coords = start + fraction[..., None] * (end - start)
+        next_waypoint = (k + 1 - self.offsets[rows]) % self.tour_lengths[rows]
+        return coords, next_waypoint, end - start
@@ -0,0 +1,169 @@
+import dataclasses
+import itertools
+import json
+import os
+import numpy as np
+
+
+META_FILE = "meta.json"
+_recorders = itertools.count()   # recorders created by this process
+
+
+def trace_directory(root, simulation_name):
+    """ A directory for a new trace in root, unique among the simulations running at the same time. """
+    return os.path.join(root, "{}-pid{}-{}".format(simulation_name, os.getpid(), next(_recorders)), "")
+
+
+def chunk_file(directory, chunk):
+    return os.path.join(directory, "chunk{:06d}.npy".format(chunk))
+
+
+def record_dtype(n_drones, float_type):
+    """ One record is the state of all the drones at one step. """
+    return np.dtype([("step", np.int64),
+                     ("coords", float_type, (n_drones, 2)),
+                     ("angle", float_type, (n_drones,)),
+                     ("speed", float_type, (n_drones,)),
+                     ("waypoint", np.int32, (n_drones,)),
+                     ("buffer", np.int32, (n_drones,))])
+
+
+class TrajectoryRecorder:
+    """ Records the state of the drones (position, heading, speed, waypoint index, buffer length) every decimation
+    steps, in a directory of .npy chunk files of chunk_size records each. A chunk is memory-mapped while it is
+    written, so the trace never lives in RAM, and meta.json tells how many records are valid, so that the trace can
+    be read with TrajectoryTrace while the simulation is still running or after it stopped abruptly. """
+
+    def __init__(self, simulator, directory, decimation=1, float32=True, chunk_size=4096):
+        self.simulator = simulator
+        self.directory = directory
+        self.decimation = decimation
+        self.chunk_size = chunk_size
+        self.n_drones = len(simulator.environment.drones)
+        self.dtype = record_dtype(self.n_drones, np.float32 if float32 else np.float64)
+
+        self.n_records = 0
+        self.__chunk = None   # memory map of the chunk being written
+        os.makedirs(directory)   # never write over another trace
+
+    def is_recorded(self, cur_step):
+        return cur_step % self.decimation == 0
+
+    def next_step(self, cur_step):
+        """ The first recorded step after cur_step. """
+        return (cur_step // self.decimation + 1) * self.decimation
+
+    def record(self, cur_step):
+        """ Appends the state of the drones, if cur_step is one of the recorded steps. """
+        if not self.is_recorded(cur_step):
+            return
+
+        position = self.n_records % self.chunk_size
+        if position == 0:
+            self.__open_chunk(self.n_records // self.chunk_size)
+
+        record = self.__chunk[position]
+        record["step"] = cur_step
+        swarm, drones = self.simulator.swarm, self.simulator.environment.drones
+        if swarm is not None:
+            record["coords"], record["angle"], record["speed"] = swarm.coords, swarm.angle, swarm.speed
+            record["waypoint"] = swarm.current_waypoint_count
+        else:
+            record["coords"] = [drone.coords for drone in drones]
+            record["angle"] = [drone.angle for drone in drones]
+            record["speed"] = [drone.speed for drone in drones]
+            record["waypoint"] = [drone.current_waypoint_count for drone in drones]
+        record["buffer"] = [drone.buffer_length() for drone in drones]
+        self.n_records += 1
+
+    def __open_chunk(self, chunk):
+        self.__close_chunk()
+        self.__chunk = np.lib.format.open_memmap(chunk_file(self.directory, chunk), mode="w+", dtype=self.dtype, shape=(self.chunk_size,))
+
+    def __close_chunk(self):
+        """ Flushes the chunk being written and publishes the records in it. """
+        if self.__chunk is not None:
+            self.__chunk.flush()
+            self.__chunk = None
+            self.__write_meta()
+
+    def __write_meta(self):
+        meta = {"n_records": self.n_records,
+                "n_drones": self.n_drones,
+                "decimation": self.decimation,
+                "chunk_size": self.chunk_size,
+                "float_type": self.dtype["angle"].base.name,
+                "config": dataclasses.asdict(self.simulator.config)}
+        with open(os.path.join(self.directory, META_FILE + ".tmp"), "w") as out_file:
+            json.dump(meta, out_file)
+        os.replace(os.path.join(self.directory, META_FILE + ".tmp"), os.path.join(self.directory, META_FILE))
+
+    def close(self):
+        """ Publishes the last records and shrinks the last chunk to them. """
+        self.__close_chunk()
+        n_last = self.n_records % self.chunk_size
+        if n_last > 0:
+            last_file = chunk_file(self.directory, self.n_records // self.chunk_size)
+            np.save(last_file, np.load(last_file)[:n_last])
+        self.__write_meta()
+
+
+class TrajectoryTrace:
+    """ A trace written by TrajectoryRecorder. Records are read from the memory-mapped chunks only when accessed,
+    so any step of a long trace is reached without loading the rest of it. """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.refresh()
+        self.__open = (None, None)   # (index, memory map) of the last chunk accessed
+
+    def refresh(self):
+        """ Reads again how many records there are, for traces still being recorded. """
+        with open(os.path.join(self.directory, META_FILE), "r") as in_file:
+            meta = json.load(in_file)
+        self.n_records, self.n_drones = meta["n_records"], meta["n_drones"]
+        self.decimation, self.chunk_size = meta["decimation"], meta["chunk_size"]
+        self.config = meta["config"]   # the fields of the SimulationConfig of the recorded simulation
+        self.dtype = record_dtype(self.n_drones, np.dtype(meta["float_type"]))
+
+    def __len__(self):
+        return self.n_records
+
+    def first_step(self):
+        return int(self[0]["step"])
+
+    def last_step(self):
+        return int(self[self.n_records - 1]["step"])
+
+    def index(self, step):
+        """ The index of the last record at or before step. """
+        return min(max(step // self.decimation, 0), self.n_records - 1)
+
+    def __chunk(self, chunk):
+        if self.__open[0] != chunk:
+            self.__open = (chunk, np.load(chunk_file(self.directory, chunk), mmap_mode="r"))
+        return self.__open[1]
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.n_records:
+            raise IndexError("record {} out of the {} of the trace".format(index, self.n_records))
+        return self.__chunk(index // self.chunk_size)[index % self.chunk_size]
+
+    def at_step(self, step):
+        """ The state of the drones at step, or at the last recorded step before it. """
+        return self[self.index(step)]
+
+    def read(self, start, stop):
+        """ The records from index start to stop (excluded), read only from the chunks holding them. """
+        start, stop = max(start, 0), min(stop, self.n_records)
+        parts = []
+        while start < stop:
+            chunk, position = divmod(start, self.chunk_size)
+            n_read = min(stop - start, self.chunk_size - position)
+            parts.append(np.array(self.__chunk(chunk)[position:position + n_read]))
+            start += n_read
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=self.dtype)
+
+    def between(self, start_step, stop_step):
+        """ The records from start_step to stop_step (excluded). """
+        return self.read(-(-start_step // self.decimation), -(-stop_step // self.decimation))
@@ -3,20 +3,23 @@
 
 from src.utilities import config
 
+import math
 import pathlib
+import subprocess
+import sys
 import time
 import json
-import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
-import pickle
 from ast import literal_eval as make_tuple
 
-from shapely.geometry import LineString
+# matplotlib, pandas, pickle and shapely are imported where needed, to keep headless simulations fast to start
 
 
 
 
+HEAVY_MODULES = ("pygame", "tkinter", "matplotlib", "pandas", "shapely")  # drawing and plotting stack
+
+
 def log(message_to_log, is_to_log=True, current_ts=1, log_every=1):
     """ Logs message_to_log, if is_to_log or every log_every steps (given current_ts). """
     if not is_to_log or not (current_ts % log_every == 0):
@@ -24,6 +27,22 @@ def log(message_to_log, is_to_log=True, current_ts=1, log_every=1):
     print(message_to_log)
 
 
+def check_headless_startup(module="src.simulation.simulator", budget_sec=None):
+    """ Imports module in a fresh interpreter and returns the seconds it took. Raises an exception if the import
+    is over budget_sec or if it pulls in the drawing and plotting stack, that headless simulations must not load. """
+    budget_sec = config.HEADLESS_IMPORT_BUDGET_SEC if budget_sec is None else budget_sec
+    code = ("import sys, time; start = time.perf_counter(); import {}; print(time.perf_counter() - start); "
+            "print(' '.join(m for m in {} if m in sys.modules))").format(module, HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.split("\n")
+
+    import_time, heavy_modules = float(output[0]), output[1].split()
+    if len(heavy_modules) > 0:
+        raise Exception("headless import of {} loads {}".format(module, ", ".join(heavy_modules)))
+    if import_time > budget_sec:
+        raise Exception("headless import of {} took {:.3f}s, budget is {:.3f}s".format(module, import_time, budget_sec))
+    return import_time
+
+
 def current_date():
     return str(time.strftime("%d%m%Y-%H%M%S"))
 
@@ -47,12 +66,14 @@ def angle_between_three_points(p1, p2, p3):
 
 def pickle_data(data, filename):
     """ save the metrics on file """
+    import pickle
     with open(filename, 'wb') as out:
         pickle.dump(data, out)
 
 
 def unpickle_data(filename):
     """ load the metrics from a file """
+    import pickle
     with open(filename, 'rb') as handle:
         obj = pickle.load(handle)
     return obj
@@ -94,6 +115,7 @@ def distance_point_segment(ps1, ps2, external_p):
 
 def is_segments_intersect(A, B, C, D):
     """ Return true if line segments AB and CD intersect """
+    from shapely.geometry import LineString
     segment1 = LineString([A, B])
     segment2 = LineString([C, D])
     point = segment1.intersection(segment2)
@@ -101,40 +123,170 @@ def is_segments_intersect(A, B, C, D):
     return not point.is_empty
 
 
+def distance_points_segments(ps1, ps2, external_p):
+    """ Batched distance_point_segment, arrays of points (..., 2) are broadcast against each other. """
+    ps1, ps2, external_p = np.asarray(ps1, dtype=float), np.asarray(ps2, dtype=float), np.asarray(external_p, dtype=float)
+    p = ps2 - ps1
+    norm = np.sum(p * p, axis=-1)
+
+    u = np.sum((external_p - ps1) * p, axis=-1) / np.where(norm > 0, norm, 1)
+    u = np.clip(u, 0, 1)
+
+    d = ps1 + u[..., None] * p - external_p
+    return np.hypot(d[..., 0], d[..., 1])
+
+
+def _orientation(a, b, c):
+    """ Sign of the cross product (b - a) x (c - a): 1 counterclockwise, -1 clockwise, 0 collinear. """
+    return np.sign((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) - (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0]))
+
+
+def _in_bounding_box(a, b, c):
+    """ True if c lays in the bounding box of the segment ab. """
+    return ((np.minimum(a[..., 0], b[..., 0]) <= c[..., 0]) & (c[..., 0] <= np.maximum(a[..., 0], b[..., 0]))
+            & (np.minimum(a[..., 1], b[..., 1]) <= c[..., 1]) & (c[..., 1] <= np.maximum(a[..., 1], b[..., 1])))
+
+
+def segments_intersect(A, B, C, D):
+    """ Batched is_segments_intersect, arrays of points (..., 2) are broadcast against each other.
+    Touching and collinear overlapping segments intersect, as in Shapely. """
+    A, B, C, D = np.asarray(A, dtype=float), np.asarray(B, dtype=float), np.asarray(C, dtype=float), np.asarray(D, dtype=float)
+    o1, o2 = _orientation(A, B, C), _orientation(A, B, D)
+    o3, o4 = _orientation(C, D, A), _orientation(C, D, B)
+
+    crossing = (o1 * o2 < 0) & (o3 * o4 < 0)
+    touching = (((o1 == 0) & _in_bounding_box(A, B, C)) | ((o2 == 0) & _in_bounding_box(A, B, D))
+                | ((o3 == 0) & _in_bounding_box(C, D, A)) | ((o4 == 0) & _in_bounding_box(C, D, B)))
+    return crossing | touching
+
+
+def distance_segments(A, B, C, D):
+    """ Batched distance between the segments AB and CD, arrays of points (..., 2) are broadcast against each other. """
+    distance = np.minimum(np.minimum(distance_points_segments(C, D, A), distance_points_segments(C, D, B)),
+                          np.minimum(distance_points_segments(A, B, C), distance_points_segments(A, B, D)))
+    return np.where(segments_intersect(A, B, C, D), 0, distance)
+
+
+COLLISION_DISTANCE = 1   # meters, a drone closer than this to an obstacle collides with it
+
+
+def collision_reach(distance_travelled):
+    """ Distance from the position of a drone within which an obstacle may have been hit in the last step. """
+    return np.maximum(distance_travelled, COLLISION_DISTANCE)
+
+
+def swept_segments_collisions(obstacles, starts, ends, reach, candidates=None):
+    """ Returns the sorted indices i of the swept segments starts[i] -> ends[i] that hit an obstacle (x1, y1, x2, y2),
+    in one pass over all the segments and obstacles. Only the obstacles within collision_reach(reach[i]) from ends[i]
+    are candidates, a candidate is hit if the swept segment crosses it or ends[i] is closer than COLLISION_DISTANCE
+    to it. If given, candidates are the pairs (segment indices, obstacle indices) from a broad phase, otherwise all
+    pairs. """
+    obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 4)
+    starts, ends = np.asarray(starts, dtype=float).reshape(-1, 2), np.asarray(ends, dtype=float).reshape(-1, 2)
+    reach = collision_reach(np.asarray(reach, dtype=float).reshape(-1))
+    if len(obstacles) == 0 or len(ends) == 0:
+        return np.zeros(0, dtype=int)
+
+    if candidates is None:
+        distances = distance_points_segments(obstacles[None, :, 0:2], obstacles[None, :, 2:4], ends[:, None, :])
+        rows, cols = np.nonzero(distances <= reach[:, None])
+        distances = distances[rows, cols]
+    else:
+        rows, cols = candidates
+        distances = distance_points_segments(obstacles[cols, 0:2], obstacles[cols, 2:4], ends[rows])
+        near = distances <= reach[rows]
+        rows, cols, distances = rows[near], cols[near], distances[near]
+
+    hit = (distances < COLLISION_DISTANCE) | segments_intersect(starts[rows], ends[rows], obstacles[cols, 0:2], obstacles[cols, 2:4])
+    return np.unique(rows[hit])
+
+
 # ------------------ Event (Traffic) Generator ----------------------
 class EventGenerator:
+    """ Samples the arrival of the events in bulk, in chunks of steps, as arrays of (step, drone index):
+        - periodic: one event every delay steps (not at step 0), on a random drone;
+        - poisson: on average one event every delay steps, on a random drone;
+        - per_drone: every drone has its own rate, in events per step.
+    The schedule depends only on the seed, not on the steps at which the simulator polls it. """
+
+    CHUNK_STEPS = 10000   # steps sampled at once
 
     def __init__(self, simulator):
         """
         :param simulator: the main simulator object
         """
         self.simulator = simulator
-        self.rnd_drones = np.random.RandomState(self.simulator.seed)
-        # for now no random on number of event generated
-        # self.rnd_event = np.random.RandomState(self.simulator.seed)
+        self.process = simulator.config.events_process
+        self.delay = simulator.config.event_generation_delay
+        self.n_drones = simulator.n_drones
+        self.rnd_drones = np.random.RandomState(self.simulator.sim_seed)
+
+        if self.process == "per_drone":
+            rates = simulator.config.drones_events_rates
+            self.rates = np.full(self.n_drones, 1 / (self.delay * self.n_drones)) if rates is None else np.asarray(rates, dtype=float)
+
+        # the sampled events not handled yet, in order of step
+        self.steps, self.drones = np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        self.next_index = 0
+        self.sampled_until = 0   # the steps before this are sampled
+
+    def __sample_chunk(self):
+        """ Samples the events of the next CHUNK_STEPS steps. """
+        first = self.sampled_until
+        last = min(first + self.CHUNK_STEPS, self.simulator.sim_duration_ts)
+        self.sampled_until = last
+
+        if self.process == "periodic":
+            steps = np.arange(max(first, 1), last)
+            steps = steps[steps % self.delay == 0]
+            drones = self.rnd_drones.randint(0, self.n_drones, size=len(steps))
+        elif self.process == "poisson":
+            steps = np.repeat(np.arange(first, last), self.rnd_drones.poisson(1 / self.delay, size=last - first))
+            drones = self.rnd_drones.randint(0, self.n_drones, size=len(steps))
+        elif self.process == "per_drone":
+            counts = self.rnd_drones.poisson(self.rates, size=(last - first, self.n_drones))
+            steps, drones = np.nonzero(counts)
+            steps, drones = np.repeat(steps + first, counts[steps, drones]), np.repeat(drones, counts[steps, drones])
+        else:
+            raise Exception("Unknown events process: {}".format(self.process))
+
+        self.steps = np.concatenate([self.steps[self.next_index:], steps])
+        self.drones = np.concatenate([self.drones[self.next_index:], drones])
+        self.next_index = 0
+
+    def next_event_step(self):
+        """ Returns the step of the next event, or None if no other event happens in the simulation. """
+        while self.next_index == len(self.steps):
+            if self.sampled_until >= self.simulator.sim_duration_ts:
+                return None
+            self.__sample_chunk()
+        return int(self.steps[self.next_index])
 
     def handle_events_generation(self, cur_step : int, drones : list):
         """
-        at fixed time randomly select a drone from the list and sample on it a packet/event.
+        samples on the drones the events up to the current step.
 
-        :param cur_step: the current step of the simulation to decide whenever sample an event or not
-        :param drones: the drones where to sample the event
+        :param cur_step: the current step of the simulation, the events scheduled until then happen
+        :param drones: the drones where to sample the events
         :return: nothing
         """
-        if cur_step > 0 and cur_step % self.simulator.event_generation_delay == 0:  # if it's time to generate a new packet
-            print(self.simulator.event_generation_delay, cur_step, cur_step % self.simulator.event_generation_delay)
-            # drone that will receive the packet:
-            drone_index = self.rnd_drones.randint(0, len(drones))
-            drone = drones[drone_index]
-            drone.feel_event(cur_step)
+        while True:
+            event_step = self.next_event_step()
+            if event_step is None or event_step > cur_step:
+                return
+            last = np.searchsorted(self.steps, cur_step, side="right")
+            for step, drone_index in zip(self.steps[self.next_index:last], self.drones[self.next_index:last]):
+                drones[drone_index].feel_event(int(step))
+            self.next_index = last
 
 # ------------------ Path manager ----------------------
 class PathManager:
 
-    def __init__(self, json_file: str, seed: int):
+    def __init__(self, json_file: str, seed: int, handcrafted_path=False):
         """ json file to read for take the paths of drones
             We assume json_file + seed + .json
         """
+        self.handcrafted_path = handcrafted_path
         self.json_file = json_file.replace(".json", "") + str(seed) + ".json"
         self.path_dict = json_to_paths(self.json_file)
 
@@ -147,7 +299,7 @@ class PathManager:
             less or more than the simulation.
             In the first case the path should be repeated.
         """
-        if config.HANDCRAFTED_PATH:
+        if self.handcrafted_path:
             return self.__demo_path(drone_id)
         else:
             return self.path_dict[drone_id]
@@ -212,6 +364,8 @@ def make_path(fname):
 
 
 def plot_X(X, plt_title, plt_path, window_size=30, is_avg=True):
+    import matplotlib.pyplot as plt
+    import pandas as pd
     if len(X) >= window_size:
         df = pd.Series(X)
         scatter_print = X[window_size:]
@@ -263,46 +417,39 @@ class TraversedCells:
 
     @staticmethod
     def cells_in_travel(size_cell, width_area, start, end):
-        """ return the cell number in which the pos (x, y) lay """
-
-        start_cell, coords_cell_start = TraversedCells.coord_to_cell(size_cell, width_area, start[0], start[1])  # int, lower left coordinates
-        end_cell, coords_cell_end = TraversedCells.coord_to_cell(size_cell, width_area, end[0], end[1])
-
-        out_cells = []
-
-        if coords_cell_end[1] == coords_cell_start[1]:  # vertical alignment
-            min_x = min(coords_cell_start[0], coords_cell_end[0])
-            max_x = max(coords_cell_start[0], coords_cell_end[0])
-            for x_ in range(min_x, max_x + 1):
-                out_cells.append((x_, coords_cell_end[1]))
-            return out_cells
-
-        if coords_cell_end[0] == coords_cell_start[0]:  # horizontal alignment
-            min_y = min(coords_cell_start[1], coords_cell_end[1])
-            max_y = max(coords_cell_start[1], coords_cell_end[1])
-            for y_ in range(min_y, max_y + 1):
-                out_cells.append((coords_cell_end[0], y_))
-            return out_cells
-
-        # Diagonal line
-        # Boundaries of the rectangle
-        min_x, max_x = min(coords_cell_start[0], coords_cell_end[0]), max(coords_cell_start[0], coords_cell_end[0])
-        min_y, max_y = min(coords_cell_start[1], coords_cell_end[1]), max(coords_cell_start[1], coords_cell_end[1])
-
-        # All the cells of the rectangle, indices
-        coords_index = [(i, j) for i in range(min_x, max_x+1) for j in range(min_y, max_y+1)]
-        for cell in coords_index:
-
-            ll = cell[0]*size_cell, cell[1]*size_cell
-            lr = cell[0]*size_cell + size_cell, cell[1]*size_cell
-            ul = cell[0]*size_cell, cell[1]*size_cell + size_cell
-            ur = cell[0]*size_cell + size_cell, cell[1]*size_cell + size_cell
-
-            if TraversedCells.intersect_quad(start, end, ll, lr, ul, ur):
-                out_cells.append(cell)
+        """ return the cells (x, y) crossed by the segment start -> end, in order of traversal (Amanatides-Woo).
+            A segment passing exactly through a corner goes diagonally, without the two cells touching it. """
+
+        _, (x, y) = TraversedCells.coord_to_cell(size_cell, width_area, start[0], start[1])
+        _, (end_x, end_y) = TraversedCells.coord_to_cell(size_cell, width_area, end[0], end[1])
+        out_cells = [(x, y)]
+
+        dx, dy = end[0] - start[0], end[1] - start[1]
+        step_x, step_y = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+
+        # travel fraction at which the segment reaches the next vertical and horizontal border, and between borders
+        t_max_x = ((x + (step_x > 0)) * size_cell - start[0]) / dx if dx != 0 else float("inf")
+        t_max_y = ((y + (step_y > 0)) * size_cell - start[1]) / dy if dy != 0 else float("inf")
+        t_delta_x = size_cell / abs(dx) if dx != 0 else float("inf")
+        t_delta_y = size_cell / abs(dy) if dy != 0 else float("inf")
+
+        while (x, y) != (end_x, end_y):
+            move_x = x != end_x and (y == end_y or t_max_x <= t_max_y)
+            move_y = y != end_y and (x == end_x or t_max_y <= t_max_x)
+            if move_x:
+                x, t_max_x = x + step_x, t_max_x + t_delta_x
+            if move_y:
+                y, t_max_y = y + step_y, t_max_y + t_delta_y
+            out_cells.append((x, y))
 
         return out_cells  # list of lower-lefts
 
+    @staticmethod
+    def coords_to_cells(size_cell, width_area, coords):
+        """ vectorized coord_to_cell, return the cell numbers and the cells (x, y) of an array of positions (n, 2) """
+        cells = (np.asarray(coords, dtype=float).reshape(-1, 2) / size_cell).astype(int)
+        return cells[:, 0] + TraversedCells.n_cells_x(size_cell, width_area) * cells[:, 1], cells
+
     @staticmethod
     def intersect_quad(start, end, ll, lr, ul, ur):
 
@@ -357,6 +504,10 @@ class TraversedCells:
     def cell_coord_to_cell_number(size_cell, width_area, x_cell_coords, y_cell_coords):
         """ return the number o the cells given the indexes """
 
-        x_cells = np.ceil(width_area / size_cell)  # numero di celle su X
+        x_cells = TraversedCells.n_cells_x(size_cell, width_area)  # numero di celle su X
         return x_cell_coords + (x_cells * y_cell_coords)
 
+    @staticmethod
+    def n_cells_x(size_cell, width_area):
+        return int(math.ceil(width_area / size_cell))
+
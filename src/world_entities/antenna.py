@@ -6,6 +6,10 @@ class AntennaEquippedDevice:
         self.can_receive = can_receive
         self.can_transmit = can_transmit
 
+    def neighbors(self):
+        """ The devices in communication range, the device must be a simulated entity with a com_range. """
+        return self.simulator.environment.neighbors_of(self)
+
     def transmit_data(self, pk):
         pass
 
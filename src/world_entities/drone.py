@@ -2,13 +2,24 @@
 from src.world_entities.entity import SimulatedEntity
 from src.world_entities.base_station import BaseStation
 from src.world_entities.antenna import AntennaEquippedDevice
+from src.world_entities.swarm import SwarmAttribute
 
 from src.utilities.utilities import euclidean_distance, log, angle_between_three_points
+from src.utilities.packet_buffer import PacketBuffer
 import numpy as np
 
 
 class Drone(SimulatedEntity, AntennaEquippedDevice):
 
+    # kinematic state, stored in the SwarmKinematics arrays when the drone is attached to one
+    swarm, swarm_index = None, None
+    coords = SwarmAttribute()
+    previous_coords = SwarmAttribute()
+    angle = SwarmAttribute()
+    speed = SwarmAttribute()
+    current_waypoint_count = SwarmAttribute()
+    tour_start = SwarmAttribute()
+
     def __init__(self,
                  identifier,
                  path: list,
@@ -22,8 +33,10 @@ class Drone(SimulatedEntity, AntennaEquippedDevice):
         AntennaEquippedDevice.__init__(self)
 
         self.path = path
+        self.waypoints = np.asarray(path, dtype=float)
         self.previous_coords = path[0]
         self.current_waypoint_count = 0
+        self.tour_start = 0   # step at which the drone (re)started its tour from path[0]
 
         self.angle, self.speed = angle, speed
         self.com_range, self.sensing_range, self.radar_range = com_range, sensing_range, radar_range
@@ -32,7 +45,7 @@ class Drone(SimulatedEntity, AntennaEquippedDevice):
 
         # parameters
         self.previous_ts_coordinate = None
-        self.buffer = list()
+        self.buffer = PacketBuffer(max_buffer)
 
     # MOVEMENT ROUTINES
 
@@ -67,7 +80,7 @@ class Drone(SimulatedEntity, AntennaEquippedDevice):
 
     def next_target(self):
         """ In case of planned movement, returns the drone target. """
-        return np.array(self.path[self.current_waypoint_count])
+        return self.waypoints[self.current_waypoint_count]
 
     def will_reach_target(self):
         """ Returns true if the drone will reach its target or overcome it in this step. """
@@ -80,7 +93,7 @@ class Drone(SimulatedEntity, AntennaEquippedDevice):
     # DRONE BUFFER
 
     def is_full(self):
-        return self.buffer_length() == self.max_buffer
+        return self.buffer.is_full()
 
     def is_known_packet(self, packet):
         return packet in self.buffer
@@ -88,20 +101,21 @@ class Drone(SimulatedEntity, AntennaEquippedDevice):
     def buffer_length(self):
         return len(self.buffer)
 
+    def add_packet(self, packet):
+        """ Stores the packet unless it is known or the buffer is full, returns whether it was stored. """
+        return self.buffer.add(packet)
+
     # DROPPING PACKETS
 
     def drop_expired_packets(self, ts):
         """ Drops expired packets form the buffer. """
-        for packet in self.buffer:
-            if packet.is_expired(ts):
-                self.buffer.remove(packet)
-                log("drone: {} - removed a packet id: {}".format(str(self.identifier), str(packet.identifier)))
+        for packet in self.buffer.drop_expired(ts):
+            log("drone: {} - removed a packet id: {}".format(str(self.identifier), str(packet.identifier)))
 
     def drop_packets(self, packets):
         """ Drops the packets from the buffer. """
         for packet in packets:
-            if packet in self.buffer:
-                self.buffer.remove(packet)
+            if self.buffer.remove(packet):
                 log("drone: {} - removed a packet id: {}".format(str(self.identifier), str(packet.identifier)))
 
     def routing(self, simulator):
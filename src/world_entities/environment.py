@@ -1,6 +1,11 @@
 
-from src.utilities.utilities import log, is_segments_intersect, distance_point_segment, TraversedCells
+from src.utilities.utilities import log, distance_points_segments, distance_segments, swept_segments_collisions, collision_reach, TraversedCells
+from src.utilities.spatial_index import ObstaclesGrid, NeighborsGrid
+from src.utilities.communication_graph import CommunicationGraph
+from src.utilities.event_store import EventStore
+from src.utilities.coverage_map import CoverageMap
 from src.world_entities.target import Target
+from src.world_entities.targets_table import TargetsTable
 
 import numpy as np
 
@@ -15,9 +20,25 @@ class Environment:
         self.height = height
 
         # set events, set obstacles
-        self.events: list = []  # even expired ones
+        sim_config = simulator.config
+        self.events = EventStore(sim_config.events_retention, sim_config.events_spill_dir + simulator.simulation_name() + "-events.pkl")
         self.obstacles = []
+        self.obstacles_array = np.zeros((0, 4))  # the obstacles as a (n_obstacles, 4) array, for batched queries
+        self.obstacles_index = None              # spatial index for the broad phase of the collision check
         self.targets = []
+        self.targets_table = None
+        self.coverage = CoverageMap(simulator.grid_cell_size, width, height) if simulator.grid_cell_size > 0 else None
+        self.n_collisions = 0
+
+        self.drones, self.base_station = [], []
+        self.neighbors = None   # devices in communication range of each other, as of the last update_neighbors
+        self.neighbors_step = None   # step of the positions in the neighbors grid
+        self.communication_graph = None
+
+        # sums over the updates of the neighbors, for the connectivity metrics
+        self.n_topology_updates = 0
+        self.bs_connectivity_sum = 0   # fraction of the drones reaching a base station
+        self.n_components_sum = 0      # partitions of the drones and base stations
 
     def add_drones(self, drones: list):
         """ add a list of drones in the env """
@@ -29,11 +50,65 @@ class Environment:
         log("Added {} base stations in the environment.".format(len(base_stations)))
         self.base_station = base_stations
 
+    def devices(self):
+        """ The antenna equipped devices, drones first and then base stations, as indexed by the neighbors grid. """
+        return self.drones + self.base_station
+
+    def update_neighbors(self):
+        """ Rebuilds the neighbors grid on the current positions of the drones and of the base stations, and adds the
+        connectivity of the new topology to the metrics. """
+        self.__rebuild_neighbors()
+
+        self.n_topology_updates += 1
+        self.bs_connectivity_sum += float(np.mean(self.communication_graph.bs_connected[:len(self.drones)])) if len(self.drones) > 0 else 0
+        self.n_components_sum += self.communication_graph.n_components
+
+    def __rebuild_neighbors(self):
+        swarm = self.simulator.swarm
+        drones_coords = swarm.coords if swarm is not None else [np.asarray(drone.coords, dtype=float) for drone in self.drones]
+        points = np.concatenate([np.asarray(drones_coords, dtype=float).reshape(-1, 2),
+                                 np.array([bs.coords for bs in self.base_station], dtype=float).reshape(-1, 2)])
+        ranges = [device.com_range for device in self.devices()]
+        self.neighbors = NeighborsGrid(points, ranges)
+        self.neighbors_step = self.simulator.cur_step
+
+        if self.communication_graph is None:
+            base_stations = np.arange(len(self.drones), len(points))
+            self.communication_graph = CommunicationGraph(len(points), base_stations)
+        self.communication_graph.update(self.neighbors.pairs)
+
+    def __fresh_neighbors(self):
+        """ Rebuilds the neighbors grid if it was not built in the current step, e.g. without NEIGHBORS_DISCOVERY,
+        leaving the metrics to the updates of the simulation. """
+        if self.neighbors is None or self.neighbors_step != self.simulator.cur_step:
+            self.__rebuild_neighbors()
+
+    def is_connected_to_bs(self, drone):
+        """ Whether the drone reaches a base station, directly or through other drones, in the current step. """
+        self.__fresh_neighbors()
+        return bool(self.communication_graph.is_connected_to_bs(self.device_index(drone)))
+
+    def device_index(self, device):
+        """ Returns the index of a drone or of a base station in the neighbors grid. """
+        if device in self.base_station:
+            return len(self.drones) + self.base_station.index(device)
+        return device.identifier
+
+    def neighbors_of(self, device):
+        """ Returns the drones and base stations in communication range of the given one, in the current step. """
+        self.__fresh_neighbors()
+        devices = self.devices()
+        return [devices[i] for i in self.neighbors.neighbors(self.device_index(device))]
+
+    def add_event(self, event):
+        self.events.append(event)
+
     def get_expired_events(self, current_ts):
-        return [e for e in self.events if e.is_expired(current_ts)]
+        """ The last expired events, the older ones are spilled to disk. """
+        return self.events.expired_events(current_ts)
 
     def get_valid_events(self, current_ts):
-        return [e for e in self.events if not e.is_expired(current_ts)]
+        return self.events.valid_events(current_ts)
 
     def query_drone_sensing(self, drone):
         """ Returns a list of valid events nj
@@ -59,28 +134,57 @@ class Environment:
             obstacle = (startx, starty, endx, endy)
             self.obstacles.append(obstacle)
 
+        self.obstacles_array = np.array(self.obstacles, dtype=float).reshape(-1, 4)
+        self.build_obstacles_index()
+
+    def build_obstacles_index(self):
+        """ Builds the static spatial index over the obstacles, to call whenever the obstacles change. """
+        cell_size = self.simulator.obstacles_cell_size
+        self.obstacles_index = ObstaclesGrid(self.obstacles_array, cell_size) if cell_size > 0 else None
+
+    def update_coverage(self):
+        """ The cells traversed by the drones in the last step are visited now. """
+        if self.coverage is not None:
+            starts, ends, _ = self.__swept_segments()
+            self.coverage.update(starts, ends, self.simulator.cur_step)
+
+    def tracks_travel(self):
+        """ Whether the segments travelled by the drones are needed at every step. """
+        return self.coverage is not None or self.targets_table is not None
+
+    def travel(self, starts, ends, first_step):
+        """ The drones travelled from starts[k] to ends[k] (steps, drones, 2) in step first_step + k, for every k:
+        the cells traversed and the targets passed by are visited then. For the runs that do not go through every
+        step. """
+        if self.coverage is not None:
+            self.coverage.update_path(starts, ends, first_step)
+        if self.targets_table is not None:
+            self.targets_table.detect_visits_path(starts, ends, self.simulator.config.targets_visit_radius, first_step)
+
     def spawn_targets(self, target_coord):
         """ Spawns target that have infinite tolerance. """
         for i, coords in enumerate(target_coord):
             self.targets.append(Target(i, coords, self.simulator.simulation_duration_sec(), self.simulator))
+        self.targets_table = TargetsTable(self.targets, self.simulator)
 
-    def detect_collision(self, drone):
-        """ Detects a collision happened in the previous step. """
-        if len(self.obstacles) > 0:
-
-            # drone - obstacle collision
-            distance_obstacles = self.distance_obstacles(drone)
-            distance_travelled = drone.speed * self.simulator.ts_duration_sec
-            critic_obstacles = np.array(self.obstacles)[distance_obstacles <= distance_travelled]  # obstacles that could be crossed in a time step
+    def detect_visits(self):
+        """ Marks as visited now the targets the drones passed by in the last step. """
+        if self.targets_table is not None:
+            starts, ends, _ = self.__swept_segments()
+            self.targets_table.detect_visits(starts, ends, self.simulator.config.targets_visit_radius, self.simulator.cur_step)
 
-            for critical_segment in critic_obstacles:
-                p1, p2 = (critical_segment[0], critical_segment[1]), (critical_segment[2], critical_segment[3])
-                p3, p4 = drone.previous_coords, drone.coords
+    def detect_collisions(self, drones=None):
+        """ Detects the collisions happened in the previous step for all the drones (or the given ones),
+        in a single batched pass. """
+        for index in self.colliding_drones(drones):
+            # COLLISION HAPPENED DO SOMETHING
+            self.handle_collision(self.drones[index] if drones is None else drones[index])
 
-                if is_segments_intersect(p1, p2, p3, p4) or distance_point_segment(p1, p2, p4) < 1:
-                    # COLLISION HAPPENED DO SOMETHING
-                    self.__handle_collision(drone)
-                    return
+    def detect_collision(self, drone):
+        """ Detects a collision happened in the previous step. """
+        if len(self.colliding_drones([drone])) > 0:
+            # COLLISION HAPPENED DO SOMETHING
+            self.handle_collision(drone)
 
         # # drone - drone collision to fix
         # if drone.coords != self.simulator.drone_coo:
@@ -102,20 +206,63 @@ class Environment:
         #
         #             if is_segments_intersect(path_u1p1, path_u1p2, path_u2p1, path_u2p2) \
         #                     or euclidean_distance(u1p2, u2p2) < 1:
-        #                 self.__handle_collision(drone)
-        #                 self.__handle_collision(other_drone)
+        #                 self.handle_collision(drone)
+        #                 self.handle_collision(other_drone)
         #                 return
 
+    def colliding_drones(self, drones=None):
+        """ Returns the indices in drones (all the drones by default) of the drones that crossed an obstacle
+        in the previous step. """
+        if len(self.obstacles) == 0:
+            return []
+
+        starts, ends, distance_travelled = self.__swept_segments(drones)
+
+        # only the obstacles in the cells around the drones can be within their reach
+        candidates = None
+        if self.obstacles_index is not None:
+            candidates = self.obstacles_index.candidates(ends, collision_reach(distance_travelled))
+
+        return swept_segments_collisions(self.obstacles_array, starts, ends, distance_travelled, candidates)
+
+    def __swept_segments(self, drones=None):
+        """ Returns the segments previous_coords -> coords travelled by the drones and their length per step. """
+        swarm = self.simulator.swarm
+        if drones is None and swarm is not None:
+            return swarm.previous_coords, swarm.coords, swarm.speed * self.simulator.ts_duration_sec
+
+        drones = self.drones if drones is None else drones
+        starts = np.array([np.asarray(drone.previous_coords, dtype=float) for drone in drones]).reshape(-1, 2)
+        ends = np.array([np.asarray(drone.coords, dtype=float) for drone in drones]).reshape(-1, 2)
+        distance_travelled = np.array([drone.speed for drone in drones], dtype=float) * self.simulator.ts_duration_sec
+        return starts, ends, distance_travelled
+
+    def obstacles_clearance(self, points, radius, ends=None):
+        """ Returns for every point (or every segment points -> ends) the distance from the closest obstacle,
+        capped to radius. """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        ends = points if ends is None else np.asarray(ends, dtype=float).reshape(-1, 2)
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), len(points))
+        clearance = radius.copy()
+        if len(self.obstacles) == 0:
+            return clearance
+
+        if self.obstacles_index is not None:
+            half_length = np.hypot(*(ends - points).T) / 2
+            rows, cols = self.obstacles_index.candidates((points + ends) / 2, radius + half_length)
+        else:
+            rows, cols = np.repeat(np.arange(len(points)), len(self.obstacles)), np.tile(np.arange(len(self.obstacles)), len(points))
+
+        distances = distance_segments(self.obstacles_array[cols, 0:2], self.obstacles_array[cols, 2:4], points[rows], ends[rows])
+        np.minimum.at(clearance, rows, distances)
+        return clearance
+
     def distance_obstacles(self, drone):
         """ Returns the distance for all the obstacles. """
+        return distance_points_segments(self.obstacles_array[:, 0:2], self.obstacles_array[:, 2:4], drone.coords)
 
-        distance_obstacles = np.array([-1] * self.simulator.n_obstacles)
-        p3 = np.array(drone.coords)
-        for en, ob in enumerate(self.obstacles):
-            p1, p2 = np.array([ob[0], ob[1]]), np.array([ob[2], ob[3]])
-            distance_obstacles[en] = distance_point_segment(p1, p2, p3)
-        return distance_obstacles
-
-    def __handle_collision(self, drone):
+    def handle_collision(self, drone):
         """ Takes countermeasure when drone collides. """
+        self.n_collisions += 1
         drone.coords = drone.path[0]
+        drone.tour_start = self.simulator.cur_step
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class SwarmAttribute:
+    """ A drone attribute that lives in the arrays of the SwarmKinematics once the drone is attached to it. """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, drone, owner=None):
+        if drone is None:
+            return self
+        if drone.swarm is None:
+            return drone.__dict__[self.name]
+        return getattr(drone.swarm, self.name)[drone.swarm_index]
+
+    def __set__(self, drone, value):
+        if drone.swarm is None:
+            drone.__dict__[self.name] = value
+        else:
+            getattr(drone.swarm, self.name)[drone.swarm_index] = value
+
+
+class SwarmKinematics:
+    """ Struct-of-arrays kinematic state of the whole swarm. Positions, headings, speeds, waypoints and tours
+    of all the drones are kept in contiguous arrays and advanced with one batched update per step.
+    The drones become thin views on row drone.swarm_index of these arrays. """
+
+    def __init__(self, drones: list, simulator, timeline=None):
+        self.simulator = simulator
+        self.drones = drones
+        self.timeline = timeline   # if given, a ToursTimeline the drones follow exactly
+        n_drones = len(drones)
+
+        self.coords = np.array([drone.coords for drone in drones], dtype=float).reshape(n_drones, 2)
+        self.previous_coords = np.array([drone.previous_coords for drone in drones], dtype=float).reshape(n_drones, 2)
+        self.angle = np.array([drone.angle for drone in drones], dtype=float)
+        self.speed = np.array([drone.speed for drone in drones], dtype=float)
+        self.current_waypoint_count = np.array([drone.current_waypoint_count for drone in drones], dtype=int)
+        self.tour_start = np.array([drone.tour_start for drone in drones], dtype=int)
+
+        # tours are padded to the longest one, tour_lengths tells how many waypoints are valid per drone
+        self.tour_lengths = np.array([len(drone.path) for drone in drones], dtype=int)
+        self.tours = np.zeros((n_drones, max(self.tour_lengths, default=1), 2))
+        for i, drone in enumerate(drones):
+            self.tours[i, :len(drone.path)] = drone.path
+
+        self.__rows = np.arange(n_drones)
+
+        for i, drone in enumerate(drones):
+            drone.swarm, drone.swarm_index = self, i
+
+    def __len__(self):
+        return len(self.drones)
+
+    def next_targets(self, indices=None):
+        """ In case of planned movement, returns the targets of all the drones (or of the drones in indices). """
+        rows = self.__rows if indices is None else indices
+        return self.tours[rows, self.current_waypoint_count[rows]]
+
+    def move(self, indices=None):
+        """ Called at every time step, batched version of Drone.move for all the drones (or the drones in indices). """
+        rows = slice(None) if indices is None else indices
+        if self.timeline is not None:
+            self.__follow_timeline(rows, self.simulator.cur_step)
+            return
+
+        coords = self.coords[rows]
+        distance_travelled = self.speed[rows] * self.simulator.ts_duration_sec
+
+        if not self.simulator.is_free_movement():
+            # drones that will reach or overcome their target in this step go for the next waypoint (cyclic visit)
+            delta = self.next_targets(indices) - coords
+            will_reach = distance_travelled >= np.hypot(delta[:, 0], delta[:, 1])
+            waypoints = self.current_waypoint_count[rows]
+            waypoints[will_reach] = (waypoints[will_reach] + 1) % self.tour_lengths[rows][will_reach]
+            self.current_waypoint_count[rows] = waypoints
+
+            delta = self.next_targets(indices) - coords
+            self.angle[rows] = np.rad2deg(np.arctan2(delta[:, 1], delta[:, 0]) % (2 * np.pi))
+
+        self.previous_coords[rows] = coords
+
+        # update coordinates based on angle
+        radians = np.radians(self.angle[rows])
+        coords = coords + distance_travelled[:, None] * np.stack([np.cos(radians), np.sin(radians)], axis=1)
+
+        # do not cross walls
+        np.clip(coords[:, 0], 0, self.simulator.env_width_meters, out=coords[:, 0])
+        np.clip(coords[:, 1], 0, self.simulator.env_height_meters, out=coords[:, 1])
+        self.coords[rows] = coords
+
+    def seek(self, step):
+        """ With a timeline, sets all the drones in their state after step, without stepping through the run. """
+        self.__follow_timeline(slice(None), step)
+
+    def path(self, first_step, last_step):
+        """ With a timeline, the segments previous_coords -> coords travelled by all the drones in every step from
+        first_step to last_step, as two (steps, drones, 2) arrays, the same as stepping through them. """
+        elapsed_steps = np.arange(first_step, last_step + 1)[:, None] - self.tour_start[None, :]
+        rows = np.broadcast_to(self.__rows, elapsed_steps.shape)
+        return self.timeline.locate(elapsed_steps, rows)[0], self.timeline.locate(elapsed_steps + 1, rows)[0]
+
+    def __follow_timeline(self, rows, step):
+        """ Sets the drones in rows in their state after step, looking their tours up in the timeline. """
+        elapsed_steps = step + 1 - self.tour_start[rows]
+        coords, waypoints, direction = self.timeline.locate(elapsed_steps, self.__rows[rows])
+
+        self.previous_coords[rows] = self.coords[rows]
+        self.coords[rows] = coords
+        self.current_waypoint_count[rows] = waypoints
+        self.angle[rows] = np.rad2deg(np.arctan2(direction[:, 1], direction[:, 0]) % (2 * np.pi))
@@ -1,10 +1,16 @@
 
 from src.world_entities.entity import SimulatedEntity
+from src.world_entities.targets_table import TargetAttribute
 import numpy as np
 
 
 class Target(SimulatedEntity):
 
+    # visit state, stored in the TargetsTable arrays when the target is attached to one
+    table, table_index = None, None
+    last_visit_ts = TargetAttribute()
+    maximum_tolerated_idleness = TargetAttribute()
+
     def __init__(self, identifier, coords, maximum_tolerated_idleness, simulator):
         SimulatedEntity.__init__(self, identifier, coords, simulator)
         self.maximum_tolerated_idleness = maximum_tolerated_idleness
@@ -24,18 +30,46 @@ class Target(SimulatedEntity):
 
     # ------ AGE OF INFORMATION -- RESIDUAL OF INFORMATION
 
+    @staticmethod
+    def __table(set_targets):
+        """ The table of the targets if they are all in the same one, None otherwise. """
+        table = set_targets[0].table if len(set_targets) > 0 else None
+        if table is not None and all(target.table is table for target in set_targets):
+            return table
+        return None
+
+    @staticmethod
+    def __ages(set_targets):
+        """ The ages of the targets, looked up in their table at once if they are in one. """
+        table = Target.__table(set_targets)
+        if table is not None:
+            return table.age_of_information([target.table_index for target in set_targets])
+        return np.array([target.age_of_information() for target in set_targets])
+
+    @staticmethod
+    def __residuals(set_targets):
+        """ The residuals of the targets, looked up in their table at once if they are in one. """
+        table = Target.__table(set_targets)
+        if table is not None:
+            return table.residual_of_information([target.table_index for target in set_targets])
+        return np.array([target.residual_of_information() for target in set_targets])
+
     @staticmethod
     def oldest(set_targets, cur_tar):
-        """ Returns the the target with the oldest age. """
-        max_aoi = np.argmax([target.age_of_information() for target in set_targets])
-        target = set_targets[max_aoi]
+        """ Returns the the target with the oldest age, from the heap of their table in O(log n) if they are all the
+        targets of the table, by a scan of their ages otherwise. """
+        table = set_targets[0].table if len(set_targets) > 0 else None
+        if table is not None and set_targets is table.targets:
+            target = set_targets[table.oldest()]
+        else:
+            target = set_targets[np.argmax(Target.__ages(set_targets))]
         assert(target != cur_tar)
         return target
 
     @staticmethod
     def lowest_residual(set_targets, cur_tar):
         """ Returns the target with the lowest percentage residual. """
-        min_res = np.argmin([target.residual_of_information() for target in set_targets])
+        min_res = np.argmin(Target.__residuals(set_targets))
         target = set_targets[min_res]
         assert(target != cur_tar)
         return target
@@ -0,0 +1,106 @@
+from src.utilities.utilities import distance_points_segments
+
+import heapq
+import numpy as np
+
+
+class TargetAttribute:
+    """ A target attribute that lives in the arrays of the TargetsTable once the target is attached to it. """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, target, owner=None):
+        if target is None:
+            return self
+        if target.table is None:
+            return target.__dict__[self.name]
+        return getattr(target.table, self.name)[target.table_index]
+
+    def __set__(self, target, value):
+        if target.table is None:
+            target.__dict__[self.name] = value
+        else:
+            getattr(target.table, self.name)[target.table_index] = value
+            if self.name == "last_visit_ts":
+                target.table.visited(target.table_index)
+
+
+class TargetsTable:
+    """ Struct-of-arrays state of the targets: coordinates, last visit and tolerated idleness of all of them are kept
+    in arrays, the visits of all the drones are detected in one batched pass per step. A heap on the last visit,
+    whose outdated entries are skipped when they get to the top, returns the oldest target in O(log n). """
+
+    def __init__(self, targets: list, simulator):
+        self.simulator = simulator
+        self.targets = targets
+        n_targets = len(targets)
+
+        self.coords = np.array([target.coords for target in targets], dtype=float).reshape(n_targets, 2)
+        self.last_visit_ts = np.array([target.last_visit_ts for target in targets], dtype=int)
+        self.maximum_tolerated_idleness = np.array([target.maximum_tolerated_idleness for target in targets], dtype=float)
+        self.n_visits = np.zeros(n_targets, dtype=int)    # a visit lasts for all the consecutive steps near a drone
+        self.__visiting = np.zeros(n_targets, dtype=bool)
+
+        self.__by_last_visit = [(ts, i) for i, ts in enumerate(self.last_visit_ts)]
+        heapq.heapify(self.__by_last_visit)
+
+        for i, target in enumerate(targets):
+            target.table, target.table_index = self, i
+
+    def __len__(self):
+        return len(self.targets)
+
+    def visited(self, index):
+        """ To call after last_visit_ts[index] changes, to keep the heap updated. """
+        heapq.heappush(self.__by_last_visit, (int(self.last_visit_ts[index]), index))
+        if len(self.__by_last_visit) > 2 * len(self) + 64:
+            self.__by_last_visit = [(ts, i) for i, ts in enumerate(self.last_visit_ts)]
+            heapq.heapify(self.__by_last_visit)
+
+    def detect_visits(self, starts, ends, visit_radius, cur_step):
+        """ Marks as visited at cur_step the targets closer than visit_radius to a segment starts[i] -> ends[i]
+        travelled by a drone in the last step, returns their indices. """
+        starts, ends = np.asarray(starts, dtype=float).reshape(1, -1, 2), np.asarray(ends, dtype=float).reshape(1, -1, 2)
+        return self.detect_visits_path(starts, ends, visit_radius, cur_step)
+
+    def detect_visits_path(self, starts, ends, visit_radius, first_step):
+        """ The drones travelled from starts[k] to ends[k] (steps, n, 2) in step first_step + k, for every k: the same
+        as detect_visits in every step, in one batched pass. Returns the indices of the targets visited in the last. """
+        if len(self) == 0:
+            return np.zeros(0, dtype=int)
+
+        distances = distance_points_segments(starts[..., None, :], ends[..., None, :], self.coords[None, None, :, :])
+        visiting = np.any(distances <= visit_radius, axis=1)   # (steps, targets)
+        before = np.vstack([self.__visiting[None, :], visiting[:-1]])
+
+        ever = np.any(visiting, axis=0)
+        last_step = first_step + len(visiting) - 1 - np.argmax(visiting[::-1], axis=0)
+        self.last_visit_ts[ever] = last_step[ever]
+        self.n_visits += np.sum(visiting & ~before, axis=0)
+        self.__visiting = visiting[-1]
+        for index in np.flatnonzero(ever):
+            self.visited(index)
+        return np.flatnonzero(visiting[-1])
+
+    def age_of_information(self, indices=None):
+        rows = slice(None) if indices is None else indices
+        return (self.simulator.cur_step - self.last_visit_ts[rows]) * self.simulator.ts_duration_sec
+
+    def residual_of_information(self, indices=None):
+        rows = slice(None) if indices is None else indices
+        return 1 - self.age_of_information(indices) / self.maximum_tolerated_idleness[rows]
+
+    def oldest(self):
+        """ Returns the index of the target with the oldest age. """
+        while True:
+            ts, index = self.__by_last_visit[0]
+            if ts == self.last_visit_ts[index]:
+                return index
+            heapq.heappop(self.__by_last_visit)
+
+    def lowest_residual(self, indices=None):
+        """ Returns the index of the target (among indices, all by default) with the lowest percentage residual. The
+        order of the residuals changes with the time when the tolerances differ, so this is a batched scan. """
+        rows = np.arange(len(self)) if indices is None else np.asarray(indices)
+        return rows[np.argmin(self.residual_of_information(rows))]